@@ -0,0 +1,119 @@
+import threading
+import time
+
+SIZE = 10
+MESSAGE_LIMIT = 4096
+HEADER = 'Изменились статусы проверки работ:'
+
+
+def render_digest(texts, limit=MESSAGE_LIMIT, header=HEADER):
+    """This function joins messages into as few telegram messages as fit."""
+    if len(texts) == 1:
+        return list(texts)
+    messages = []
+    current = header
+    for text in texts:
+        line = f'\n— {text}'
+        if len(current) + len(line) > limit and current != header:
+            messages.append(current)
+            current = header
+        current += line
+    messages.append(current)
+    return messages
+
+
+class Digest:
+    """Buffers items per chat until `size` of them or `window` seconds.
+
+    The first buffered item of a chat waits at most `window` seconds.
+    """
+
+    def __init__(self, window, size=SIZE):
+        """This function creates an empty digest."""
+        self.window = window
+        self.size = size
+        self.buffers = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        """This function returns the number of buffered items."""
+        with self.lock:
+            return sum(len(items) for _, items in self.buffers.values())
+
+    def add(self, key, item, now=None):
+        """This function buffers an item for the chat."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.buffers.setdefault(key, (now, []))[1].append(item)
+
+    def dump(self, now=None):
+        """This function returns the buffers with their age as JSON data."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            return [
+                [key, now - started, list(items)]
+                for key, (started, items) in self.buffers.items()
+            ]
+
+    def load(self, data, now=None):
+        """This function restores buffers from `dump()`, keeping their age."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            for key, age, items in data:
+                self.buffers.setdefault(key, (now - age, []))[1].extend(items)
+
+    def next_deadline(self):
+        """This function returns when the oldest buffer falls due."""
+        with self.lock:
+            if not self.buffers:
+                return None
+            oldest = min(started for started, _ in self.buffers.values())
+        return oldest + self.window
+
+    def due(self, now=None):
+        """This function takes the batches that are full or old enough."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            ready = [
+                key for key, (started, items) in self.buffers.items()
+                if len(items) >= self.size or started + self.window <= now
+            ]
+            return [(key, self.buffers.pop(key)[1]) for key in ready]
+
+
+def replay(events, window, size=SIZE):
+    """This function replays `(time, chat_id, text)` events in order.
+
+    Batches are flushed exactly when they fall due, as the bot does
+    between polls.
+    Returns the number of send calls with and without the digest and the
+    longest delay of a message.
+    """
+    digest = Digest(window, size)
+    messages = sends = 0
+    longest = 0.0
+
+    def flush(now):
+        nonlocal sends, longest
+        for _, batch in digest.due(now):
+            sends += len(render_digest([text for _, text in batch]))
+            longest = max(longest, now - batch[0][0])
+
+    for now, chat_id, text in events:
+        deadline = digest.next_deadline()
+        while deadline is not None and deadline <= now:
+            flush(deadline)
+            deadline = digest.next_deadline()
+        digest.add(chat_id, (now, text), now)
+        messages += 1
+        flush(now)
+    while digest.buffers:
+        flush(digest.next_deadline())
+    return {
+        'messages': messages,
+        'sends': sends,
+        'reduction': 1 - sends / messages if messages else 0.0,
+        'max_delay_s': longest,
+        'window_s': window,
+        'size': size,
+    }
@@ -0,0 +1,206 @@
+import threading
+import time
+from collections import OrderedDict, deque
+
+from exceptions import NoHomeworksError, OutboxFullError
+
+STATUS = 'status'
+ERROR = 'error'
+MAX_ERROR_WAIT = 60
+MAX_STATUSES = 10000
+MAX_ERRORS = 1000
+LATENCY_SAMPLES = 1000
+MAX_ATTEMPTS = 5
+
+
+class Message:
+    """A message waiting in the outbox."""
+
+    __slots__ = (
+        'chat_id', 'text', 'priority', 'enqueued', 'repeats', 'attempts'
+    )
+
+    def __init__(self, chat_id, text, priority):
+        """This function creates a message enqueued now."""
+        self.chat_id = chat_id
+        self.text = text
+        self.priority = priority
+        self.enqueued = time.monotonic()
+        self.repeats = 1
+        self.attempts = 0
+
+
+class Outbox:
+    """Priority queue of messages waiting to be sent to telegram.
+
+    Status transitions are delivered first. Error notices are coalesced
+    per chat and text and only sent when no transition is waiting, unless
+    they have waited longer than `max_error_wait` seconds: then every
+    other message is an error notice, so neither class is starved.
+
+    At most `max_statuses` transitions are kept: producers wait for room.
+    Error notices beyond `max_errors` evict the oldest one instead.
+    A message that failed to send is retried behind the other chats and
+    dropped after `max_attempts` failures.
+    """
+
+    def __init__(self, max_error_wait=MAX_ERROR_WAIT,
+                 max_statuses=MAX_STATUSES, max_errors=MAX_ERRORS,
+                 max_attempts=MAX_ATTEMPTS):
+        """This function creates an empty outbox."""
+        self.max_error_wait = max_error_wait
+        self.max_statuses = max_statuses
+        self.max_errors = max_errors
+        self.max_attempts = max_attempts
+        self.statuses = deque()
+        self.errors = OrderedDict()
+        self.latencies = {
+            STATUS: deque(maxlen=LATENCY_SAMPLES),
+            ERROR: deque(maxlen=LATENCY_SAMPLES),
+        }
+        self.sent = {STATUS: 0, ERROR: 0}
+        self.dropped = {STATUS: 0, ERROR: 0}
+        self.last_delivered = None
+        self.promoted = False
+        self.closed = False
+        self.lock = threading.Lock()
+        self.room = threading.Condition(self.lock)
+
+    def __len__(self):
+        """This function returns the number of queued messages."""
+        return len(self.statuses) + len(self.errors)
+
+    def put_status(self, chat_id, text, timeout=None):
+        """This function queues a transition, waiting for room if full."""
+        with self.room:
+            has_room = self.room.wait_for(
+                lambda: len(self.statuses) < self.max_statuses
+                or self.closed,
+                timeout
+            )
+            if not has_room or self.closed:
+                raise OutboxFullError(
+                    f'{len(self.statuses)} transitions are waiting'
+                )
+            self.statuses.append(Message(chat_id, text, STATUS))
+
+    def close(self):
+        """This function wakes up and rejects waiting producers."""
+        with self.room:
+            self.closed = True
+            self.room.notify_all()
+
+    def put_error(self, chat_id, error, text):
+        """This function queues an error notice unless one is pending."""
+        if isinstance(error, NoHomeworksError):
+            return
+        with self.lock:
+            pending = self.errors.get((chat_id, text))
+            if pending is not None:
+                pending.repeats += 1
+            else:
+                self.errors[chat_id, text] = Message(chat_id, text, ERROR)
+                if len(self.errors) > self.max_errors:
+                    self.errors.popitem(last=False)
+
+    def pop(self):
+        """This function takes the next message to send or returns None."""
+        with self.lock:
+            if self.errors:
+                oldest = next(iter(self.errors.values()))
+                waited = time.monotonic() - oldest.enqueued
+                promote = (
+                    waited >= self.max_error_wait and not self.promoted
+                )
+                if promote or not self.statuses:
+                    self.promoted = promote
+                    return self.errors.popitem(last=False)[1]
+            self.promoted = False
+            if self.statuses:
+                self.room.notify()
+                return self.statuses.popleft()
+            return None
+
+    def requeue(self, message):
+        """This function puts a failed message behind the other chats.
+
+        Returns False if the message was dropped after `max_attempts`.
+        """
+        message.attempts += 1
+        if message.attempts >= self.max_attempts:
+            self.drop(message)
+            return False
+        with self.lock:
+            if message.priority == STATUS:
+                others = [
+                    queued for queued in self.statuses
+                    if queued.chat_id != message.chat_id
+                ]
+                same_chat = [
+                    queued for queued in self.statuses
+                    if queued.chat_id == message.chat_id
+                ]
+                self.statuses = deque(others + [message] + same_chat)
+            else:
+                self.errors[message.chat_id, message.text] = message
+        return True
+
+    def drop(self, message):
+        """This function gives up on a message that cannot be sent."""
+        with self.lock:
+            self.dropped[message.priority] += 1
+
+    def delivered(self, message):
+        """This function records time to delivery of a sent message."""
+        with self.lock:
+            self.sent[message.priority] += 1
+            self.last_delivered = time.time()
+            self.latencies[message.priority].append(
+                time.monotonic() - message.enqueued
+            )
+
+    def drain(self, send, undeliverable=()):
+        """This function sends queued messages until the outbox is empty.
+
+        A message whose `send(chat_id, text)` raises is put back, or dropped
+        if the exception is one of `undeliverable`, and the exception is
+        propagated.
+        """
+        message = self.pop()
+        while message is not None:
+            try:
+                send(message.chat_id, message.text)
+            except undeliverable:
+                self.drop(message)
+                raise
+            except Exception:
+                self.requeue(message)
+                raise
+            self.delivered(message)
+            message = self.pop()
+
+    def stats(self):
+        """This function summarizes time to delivery per priority class.
+
+        Percentiles cover the last LATENCY_SAMPLES deliveries.
+        """
+        with self.lock:
+            latencies = {
+                priority: sorted(values)
+                for priority, values in self.latencies.items()
+            }
+            sent = dict(self.sent)
+            dropped = dict(self.dropped)
+        return {
+            priority: {
+                'delivered': sent[priority],
+                'dropped': dropped[priority],
+                'p50_s': values[len(values) // 2] if values else None,
+                'p99_s': (
+                    values[min(len(values) - 1, int(0.99 * len(values)))]
+                    if values else None
+                ),
+                'max_s': values[-1] if values else None,
+            }
+            for priority, values in latencies.items()
+        }
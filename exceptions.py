@@ -14,3 +14,15 @@ class ApiNotRespondingError(Exception):
     """API did not respond."""
 
     pass
+
+
+class OutboxFullError(Exception):
+    """The outbox stayed full or was closed while waiting for room."""
+
+    pass
+
+
+class ReplacedError(Exception):
+    """The watchdog replaced the polling thread while it was stuck."""
+
+    pass
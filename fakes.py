@@ -0,0 +1,169 @@
+import json
+import random
+import threading
+import time
+import zlib
+from collections import Counter, deque
+from datetime import datetime, timezone
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telegram.error import RetryAfter
+
+STATUSES = ('reviewing', 'rejected', 'approved')
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+
+class FakeUpstream:
+    """Local stand-in for the homework statuses API.
+
+    Every token owns a single homework whose status flips every
+    `change_interval` seconds; flips of different tokens are spread
+    evenly across the interval. A share of `error_rate` requests fails
+    with 500 Internal Server Error. Every reply is delayed by `latency`
+    seconds to mimic the network.
+    """
+
+    def __init__(self, change_interval=1.0, error_rate=0.0, latency=0.0,
+                 host='127.0.0.1', port=0):
+        """This function binds the server without starting it."""
+        self.change_interval = change_interval
+        self.error_rate = error_rate
+        self.latency = latency
+        self.started = time.time()
+        self.server = ThreadingHTTPServer((host, port), _UpstreamHandler)
+        self.server.daemon_threads = True
+        self.server.upstream = self
+        self.thread = None
+
+    @property
+    def endpoint(self):
+        """This property returns the URL to point ENDPOINT at."""
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/api/user_api/homework_statuses/'
+
+    def homework(self, token, now=None):
+        """This function returns the current homework of the token."""
+        now = time.time() if now is None else now
+        offset = zlib.crc32(token.encode()) % 1000 / 1000
+        offset *= self.change_interval
+        flips = int((now - self.started + offset) // self.change_interval)
+        updated = self.started - offset + flips * self.change_interval
+        return {
+            'id': 1,
+            'homework_name': f'{token}.zip',
+            'status': STATUSES[flips % len(STATUSES)],
+            'date_updated': datetime.fromtimestamp(
+                updated, timezone.utc
+            ).strftime(DATE_FORMAT),
+        }
+
+    def reply(self, token, from_date):
+        """This function builds the API response for the token."""
+        if self.latency:
+            time.sleep(self.latency)
+        if random.random() < self.error_rate:
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {}
+        now = time.time()
+        homework = self.homework(token, now)
+        updated = parse_date(homework['date_updated'])
+        homeworks = [homework] if updated >= from_date else []
+        return HTTPStatus.OK, {
+            'homeworks': homeworks, 'current_date': int(now)
+        }
+
+    def start(self):
+        """This function starts serving in a background thread."""
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, daemon=True
+        )
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """This function stops serving and closes the socket."""
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        """This function starts the server."""
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        """This function stops the server."""
+        self.stop()
+
+
+class _UpstreamHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        token = self.headers.get('Authorization', '').replace('OAuth ', '')
+        query = self.path.partition('?')[2]
+        params = dict(
+            pair.partition('=')[::2] for pair in query.split('&') if pair
+        )
+        try:
+            from_date = float(params.get('from_date') or 0)
+        except ValueError:
+            from_date = 0
+        status, data = self.server.upstream.reply(token, from_date)
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeBot:
+    """Stand-in for telegram.Bot that records sent messages.
+
+    With `rate` set, sends beyond `rate` per second fail with RetryAfter
+    like Telegram flood control does.
+    """
+
+    def __init__(self, latency=0.0, rate=None):
+        """This function creates a bot with no sent messages."""
+        self.latency = latency
+        self.rate = rate
+        self.sent = 0
+        self.rejected = 0
+        self.chats = Counter()
+        self.recent = deque()
+        self.lock = threading.Lock()
+
+    def send_message(self, chat_id, text, **kwargs):
+        """This function pretends to deliver a message."""
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            if self.rate:
+                now = time.monotonic()
+                while self.recent and now - self.recent[0] >= 1:
+                    self.recent.popleft()
+                if len(self.recent) >= self.rate:
+                    self.rejected += 1
+                    raise RetryAfter(1 - (now - self.recent[0]))
+                self.recent.append(now)
+            self.sent += 1
+            self.chats[chat_id] += 1
+            return self.sent
+
+
+def parse_date(value):
+    """This function converts `date_updated` into a timestamp."""
+    return datetime.strptime(value, DATE_FORMAT).replace(
+        tzinfo=timezone.utc
+    ).timestamp()
+
+
+def serve_upstream(connection, change_interval, error_rate=0.0, latency=0.0):
+    """This function runs FakeUpstream in a child process."""
+    with FakeUpstream(change_interval, error_rate, latency) as upstream:
+        connection.send(upstream.endpoint)
+        connection.recv()
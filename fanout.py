@@ -0,0 +1,238 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from telegram.error import BadRequest, NetworkError, RetryAfter, Unauthorized
+
+import profiling
+from digest import HEADER, render_digest
+
+WORKERS = 32
+RATE = 30
+RETRIES = 3
+BACKOFF = 1.0
+FLOOD_WAIT = 60
+MAX_PENDING = 100
+UNDELIVERABLE = (BadRequest, Unauthorized)
+DEFAULT_LOCALE = 'ru'
+logger = logging.getLogger(__name__)
+
+
+class Recipient:
+    """A chat receiving status updates and its delivery state.
+
+    `pending` keeps up to MAX_PENDING texts that failed to send and are
+    sent again before anything new.
+    """
+
+    def __init__(self, chat_id, locale=DEFAULT_LOCALE, muted=False):
+        """This function creates a recipient with no deliveries."""
+        self.chat_id = chat_id
+        self.locale = locale
+        self.muted = muted
+        self.delivered = 0
+        self.failed = 0
+        self.last_delivered = None
+        self.last_error = None
+        self.pending = deque(maxlen=MAX_PENDING)
+
+
+class RateLimiter:
+    """Spaces out calls to at most `rate` per second across threads."""
+
+    def __init__(self, rate):
+        """This function allows the first call at once."""
+        self.interval = 1 / rate if rate else 0
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        """This function blocks until the caller may send."""
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            if self.interval:
+                self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def pause(self, seconds):
+        """This function holds back every caller for the given time."""
+        with self.lock:
+            self.next_slot = max(
+                self.next_slot, time.monotonic() + seconds
+            )
+
+
+class FanOut:
+    """Delivers one status transition to many chats in parallel.
+
+    The message is rendered once per locale with `renderers[locale]`;
+    digests of several messages start with `headers[locale]`.
+    Sends are spread over `workers` threads and limited to `rate` per
+    second. Flood control pauses every sender for the time Telegram asks,
+    for at most `flood_wait` seconds per message. Network errors are
+    retried `retries` times with exponential backoff, other Telegram
+    errors fail the recipient at once. Texts that failed for another
+    reason than the chat being rejected are sent again by `retry()` or
+    before the recipient's next message.
+    """
+
+    def __init__(self, bot, renderers, headers=None, workers=WORKERS,
+                 rate=RATE, retries=RETRIES, backoff=BACKOFF,
+                 flood_wait=FLOOD_WAIT):
+        """This function starts the sender threads."""
+        self.bot = bot
+        self.renderers = renderers
+        self.headers = headers or {}
+        self.retries = retries
+        self.backoff = backoff
+        self.flood_wait = flood_wait
+        self.limiter = RateLimiter(rate)
+        self.executor = ThreadPoolExecutor(
+            workers, thread_name_prefix='fanout'
+        )
+        self.recipients = {}
+
+    def subscribe(self, chat_id, locale=DEFAULT_LOCALE):
+        """This function adds a chat to the recipients."""
+        if locale not in self.renderers:
+            locale = DEFAULT_LOCALE
+        self.recipients[chat_id] = Recipient(chat_id, locale)
+        return self.recipients[chat_id]
+
+    def mute(self, chat_id, muted=True):
+        """This function stops or resumes updates for the chat."""
+        self.recipients[chat_id].muted = muted
+
+    def render(self, homeworks, recipients):
+        """This function renders the messages once per locale used."""
+        return {
+            locale: render_digest(
+                [self.renderers[locale](homework) for homework in homeworks],
+                header=self.headers.get(locale, HEADER)
+            )
+            for locale in {recipient.locale for recipient in recipients}
+        }
+
+    def send_all(self, recipient, texts):
+        """This function delivers pending and new texts in order.
+
+        On failure the unsent texts are kept as pending, unless Telegram
+        rejected the chat.
+        """
+        texts = list(recipient.pending) + list(texts)
+        recipient.pending.clear()
+        for number, text in enumerate(texts):
+            if not self.send(recipient, text):
+                if not isinstance(recipient.last_error, UNDELIVERABLE):
+                    recipient.pending.extend(texts[number:])
+                return False
+        return True
+
+    def send(self, recipient, text):
+        """This function delivers the text to one recipient."""
+        attempt = 0
+        deadline = time.monotonic() + self.flood_wait
+        while attempt <= self.retries:
+            self.limiter.wait()
+            try:
+                with profiling.stage('telegram'):
+                    self.bot.send_message(recipient.chat_id, text)
+            except RetryAfter as error:
+                recipient.last_error = error
+                if time.monotonic() + error.retry_after > deadline:
+                    break
+                self.limiter.pause(error.retry_after)
+            except UNDELIVERABLE as error:
+                recipient.last_error = error
+                break
+            except NetworkError as error:
+                recipient.last_error = error
+                time.sleep(self.backoff * 2 ** attempt)
+                attempt += 1
+            except Exception as error:
+                recipient.last_error = error
+                break
+            else:
+                recipient.delivered += 1
+                recipient.last_delivered = time.time()
+                return True
+        recipient.failed += 1
+        logger.error(
+            f'Failed to send message to {recipient.chat_id}, '
+            f'reason: {recipient.last_error}'
+        )
+        return False
+
+    def publish(self, homework):
+        """This function sends the transition to every unmuted chat."""
+        return self.publish_many([homework])
+
+    def publish_many(self, homeworks):
+        """This function sends the transitions as one digest per chat."""
+        recipients = [
+            recipient for recipient in self.recipients.values()
+            if not recipient.muted
+        ]
+        texts = self.render(homeworks, recipients)
+        results = list(self.executor.map(
+            lambda recipient: self.send_all(
+                recipient, texts[recipient.locale]
+            ),
+            recipients
+        ))
+        return {
+            'sent': results.count(True),
+            'failed': results.count(False),
+            'muted': len(self.recipients) - len(recipients),
+            'rendered': len(texts),
+        }
+
+    def defer(self, homeworks):
+        """This function queues the transitions to be sent by `retry()`."""
+        recipients = [
+            recipient for recipient in self.recipients.values()
+            if not recipient.muted
+        ]
+        texts = self.render(homeworks, recipients)
+        for recipient in recipients:
+            recipient.pending.extend(texts[recipient.locale])
+
+    def dump(self):
+        """This function returns the pending texts per chat as JSON data."""
+        return [
+            [recipient.chat_id, list(recipient.pending)]
+            for recipient in list(self.recipients.values())
+            if recipient.pending
+        ]
+
+    def load(self, data):
+        """This function restores pending texts of subscribed chats."""
+        for chat_id, texts in data:
+            if chat_id in self.recipients:
+                self.recipients[chat_id].pending.extend(texts)
+
+    def pending(self):
+        """This function returns the number of texts waiting for a retry."""
+        return sum(
+            len(recipient.pending)
+            for recipient in list(self.recipients.values())
+        )
+
+    def retry(self):
+        """This function sends the pending texts of every unmuted chat."""
+        recipients = [
+            recipient for recipient in self.recipients.values()
+            if recipient.pending and not recipient.muted
+        ]
+        results = list(self.executor.map(
+            lambda recipient: self.send_all(recipient, ()), recipients
+        ))
+        return {'sent': results.count(True), 'failed': results.count(False)}
+
+    def close(self):
+        """This function stops the worker threads."""
+        self.executor.shutdown(wait=True)
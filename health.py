@@ -0,0 +1,178 @@
+import json
+import logging
+import sys
+import threading
+import time
+import traceback
+from datetime import datetime
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHECK_INTERVAL = 10
+logger = logging.getLogger(__name__)
+
+
+def timestamp(value):
+    """This function formats a unix time for the report."""
+    if value is None:
+        return None
+    return datetime.fromtimestamp(value).isoformat(timespec='seconds')
+
+
+def dump_stacks():
+    """This function formats the current stack of every thread."""
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    return '\n'.join(
+        f'Thread {names.get(ident, ident)}:\n'
+        + ''.join(traceback.format_stack(frame))
+        for ident, frame in sys._current_frames().items()
+    )
+
+
+class Component:
+    """A loop running in its own thread that the watchdog can replace.
+
+    `target(component, generation)` must call `component.beat(generation)`
+    at least every `stall_timeout` seconds and return once it is False.
+    """
+
+    def __init__(self, name, target, stall_timeout):
+        """This function creates a component not yet started."""
+        self.name = name
+        self.target = target
+        self.stall_timeout = stall_timeout
+        self.generation = 0
+        self.restarts = 0
+        self.heartbeat = time.monotonic()
+        self.thread = None
+
+    def start(self):
+        """This function runs a new generation of the loop."""
+        self.generation += 1
+        self.heartbeat = time.monotonic()
+        self.thread = threading.Thread(
+            target=self.target, args=(self, self.generation),
+            name=f'{self.name}-{self.generation}', daemon=True
+        )
+        self.thread.start()
+
+    def beat(self, generation):
+        """This function records progress, False if the loop was replaced."""
+        if generation != self.generation:
+            return False
+        self.heartbeat = time.monotonic()
+        return True
+
+    def stalled(self):
+        """This function tells whether the loop died or stopped beating."""
+        return (
+            not self.thread.is_alive()
+            or time.monotonic() - self.heartbeat > self.stall_timeout
+        )
+
+    def state(self):
+        """This function describes the component for the health report."""
+        return {
+            'alive': self.thread is not None and self.thread.is_alive(),
+            'stalled': self.thread is not None and self.stalled(),
+            'heartbeat_age_s': round(time.monotonic() - self.heartbeat, 3),
+            'restarts': self.restarts,
+        }
+
+
+class Watchdog:
+    """Replaces components that died or stalled, dumping all stacks."""
+
+    def __init__(self, components, interval=CHECK_INTERVAL):
+        """This function watches the components."""
+        self.components = components
+        self.interval = interval
+        self.stopping = threading.Event()
+
+    def check(self):
+        """This function restarts every stalled component."""
+        for component in self.components:
+            if not component.stalled():
+                continue
+            logger.error(
+                f'{component.name} stalled, restarting it\n{dump_stacks()}'
+            )
+            component.restarts += 1
+            component.start()
+
+    def run(self):
+        """This function checks the components until stopped."""
+        while not self.stopping.wait(self.interval):
+            self.check()
+
+
+class Health:
+    """What the health endpoint reports about the worker.
+
+    `gauges` map names to callables evaluated on every request, such as
+    queue depths or the time of the last send.
+    """
+
+    def __init__(self, components=(), gauges=None):
+        """This function creates a report with no poll yet."""
+        self.components = list(components)
+        self.gauges = dict(gauges or {})
+        self.last_poll = None
+
+    def polled(self):
+        """This function records a successful poll."""
+        self.last_poll = time.time()
+
+    def ready(self):
+        """This function tells whether every component makes progress."""
+        return self.last_poll is not None and not any(
+            component.stalled() for component in self.components
+        )
+
+    def report(self):
+        """This function collects the health report."""
+        return {
+            'ready': self.ready(),
+            'last_poll': timestamp(self.last_poll),
+            'components': {
+                component.name: component.state()
+                for component in self.components
+            },
+            **{name: gauge() for name, gauge in self.gauges.items()},
+        }
+
+
+class _HealthHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        health = self.server.health
+        if self.path == '/health':
+            status, report = HTTPStatus.OK, health.report()
+        elif self.path == '/ready':
+            report = health.report()
+            status = (
+                HTTPStatus.OK if report['ready']
+                else HTTPStatus.SERVICE_UNAVAILABLE
+            )
+        else:
+            status, report = HTTPStatus.NOT_FOUND, {}
+        body = json.dumps(report, default=str).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_health(health, port, host='0.0.0.0'):
+    """This function serves /health and /ready in a background thread."""
+    server = ThreadingHTTPServer((host, port), _HealthHandler)
+    server.daemon_threads = True
+    server.health = health
+    threading.Thread(
+        target=server.serve_forever, name='health', daemon=True
+    ).start()
+    return server
@@ -1,6 +1,8 @@
+import json
 import logging
 import os
 import sys
+import threading
 import time
 from http import HTTPStatus
 from logging import StreamHandler
@@ -8,9 +10,21 @@ from logging import StreamHandler
 import requests
 import telegram
 from telegram.error import TelegramError
+from telegram.utils.request import Request
 from dotenv import load_dotenv
 
-from exceptions import LoggedOnlyError, NoHomeworksError, ApiNotRespondingError
+import profiling
+from digest import HEADER as DIGEST_HEADER, SIZE, Digest
+from dispatch import Outbox
+from fanout import (
+    DEFAULT_LOCALE, UNDELIVERABLE, WORKERS as FANOUT_WORKERS, FanOut
+)
+from health import Component, Health, Watchdog, serve_health, timestamp
+from incidents import ErrorAggregator
+from exceptions import (
+    LoggedOnlyError, NoHomeworksError, ApiNotRespondingError, ReplacedError
+)
+from window import Window
 
 load_dotenv()
 
@@ -18,6 +32,11 @@ PRACTICUM_TOKEN = os.getenv('PRACTICUM_TOKEN')
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
 TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
 RETRY_TIME = 600
+LOOKBACK = RETRY_TIME
+TIMEOUT = 30
+STALL_TIMEOUT = 2 * RETRY_TIME
+HEALTH_PORT = os.getenv('HEALTH_PORT')
+WINDOW_FILE = os.getenv('WINDOW_FILE')
 ENDPOINT = 'https://practicum.yandex.ru/api/user_api/homework_statuses/'
 HEADERS = {'Authorization': f'OAuth {PRACTICUM_TOKEN}'}
 REVIEWER_REPLY = {
@@ -25,9 +44,18 @@ REVIEWER_REPLY = {
     'reviewing': 'Работа взята на проверку ревьюером.',
     'rejected': 'Работа проверена: у ревьюера есть замечания.'
 }
+REVIEWER_REPLY_EN = {
+    'approved': 'The reviewer liked everything. Hooray!',
+    'reviewing': 'The reviewer has started the review.',
+    'rejected': 'The reviewer has some remarks.'
+}
+FANOUT_CHAT_IDS = os.getenv('TELEGRAM_FANOUT_CHAT_IDS', '')
+DIGEST_WINDOW = int(os.getenv('DIGEST_WINDOW', 0))
+DIGEST_SIZE = int(os.getenv('DIGEST_SIZE', SIZE))
 logger = logging.getLogger(__name__)
 
 
+@profiling.timed('telegram')
 def send_message(bot, message):
     """This function sends messages to telegram."""
     try:
@@ -37,17 +65,26 @@ def send_message(bot, message):
         raise LoggedOnlyError(f'Failed to send message, reason: {error}')
 
 
-def get_api_answer(current_timestamp):
-    """This function receives reply from Yandex Praktikum."""
-    timestamp = current_timestamp
-    params = {'from_date': timestamp}
-    response = requests.get(ENDPOINT, headers=HEADERS, params=params)
+def request_homeworks(current_timestamp, headers=HEADERS, session=None):
+    """This function requests homeworks with the given credentials."""
+    params = {'from_date': current_timestamp}
+    with profiling.stage('network'):
+        response = (session or requests).get(
+            ENDPOINT, headers=headers, params=params, timeout=TIMEOUT
+        )
     if response.status_code != HTTPStatus.OK:
         raise ApiNotRespondingError(f'response code is {response.status_code}')
-    homework = response.json()
+    with profiling.stage('json'):
+        homework = response.json()
     return homework
 
 
+def get_api_answer(current_timestamp):
+    """This function receives reply from Yandex Praktikum."""
+    return request_homeworks(current_timestamp)
+
+
+@profiling.timed('check_response')
 def check_response(response):
     """Checking whether the response from Yandex Praktikum is valid."""
     if not response:
@@ -73,6 +110,7 @@ def check_response(response):
     return homework
 
 
+@profiling.timed('parse_status')
 def parse_status(homework):
     """This function obtains specific values of the homework."""
     if not list:
@@ -83,6 +121,314 @@ def parse_status(homework):
     return f'Изменился статус проверки работы "{homework_name}". {verdict}'
 
 
+@profiling.timed('parse_status')
+def parse_status_en(homework):
+    """This function obtains specific values of the homework in English."""
+    homework_name = homework.get('homework_name')
+    verdict = REVIEWER_REPLY_EN[homework.get('status')]
+    return f'Review status of "{homework_name}" has changed. {verdict}'
+
+
+RENDERERS = {'ru': parse_status, 'en': parse_status_en}
+DIGEST_HEADERS = {'ru': DIGEST_HEADER, 'en': 'Review statuses have changed:'}
+
+
+class Subscription:
+    """Homeworks of one Practicum token reported to one chat."""
+
+    def __init__(self, token, chat_id, timestamp=0):
+        """This function builds the headers and the window."""
+        self.token = token
+        self.headers = {'Authorization': f'OAuth {token}'}
+        self.chat_id = chat_id
+        self.window = Window(timestamp)
+
+
+def fetch_subscription(subscription, session=None):
+    """This function requests the homeworks of the subscription."""
+    window = subscription.window
+    window.behind = False
+    return request_homeworks(
+        window.from_date(), subscription.headers, session
+    )
+
+
+def known_homeworks(homeworks):
+    """This function logs and skips homeworks with an unknown status."""
+    known = []
+    for homework in homeworks:
+        if homework.get('status') in REVIEWER_REPLY:
+            known.append(homework)
+        else:
+            logger.error(
+                f'Skipping "{homework.get("homework_name")}", '
+                f'unknown status: {homework.get("status")}'
+            )
+    return known
+
+
+def advance_subscription(subscription, response):
+    """This function moves the window and returns changed homeworks.
+
+    Homeworks with an unknown status are skipped before the window sees
+    them, so they cannot stop the others from being sent.
+    """
+    try:
+        homeworks = known_homeworks(check_response(response))
+    except NoHomeworksError:
+        homeworks = []
+    if response.get('current_date') is None:
+        logger.warning('current_date is missing, keeping the window')
+    return subscription.window.advance(
+        homeworks, response.get('current_date')
+    )
+
+
+def load_state(worker, path):
+    """This function restores the worker state saved at the path, if any."""
+    try:
+        with open(path) as file:
+            worker.load(json.load(file))
+    except FileNotFoundError:
+        return False
+    except (OSError, ValueError, KeyError, TypeError) as error:
+        logger.warning(f'Failed to load WINDOW_FILE, reason: {error}')
+        return False
+    return True
+
+
+def save_state(worker, path):
+    """This function saves the worker state to the path."""
+    try:
+        with open(f'{path}.tmp', 'w') as file:
+            json.dump(worker.dump(), file)
+        os.replace(f'{path}.tmp', path)
+    except OSError as error:
+        logger.warning(f'Failed to save WINDOW_FILE, reason: {error}')
+
+
+def poll_subscription(subscription, session=None):
+    """This function returns homeworks whose status has changed."""
+    return advance_subscription(
+        subscription, fetch_subscription(subscription, session)
+    )
+
+
+def deliver(bot, outbox):
+    """This function sends queued messages, most important first."""
+    try:
+        outbox.drain(
+            profiling.timed('telegram')(bot.send_message), UNDELIVERABLE
+        )
+    except TelegramError as error:
+        logger.error(f'Failed to send message, reason: {error}')
+
+
+def make_bot():
+    """This function creates the bot with a pool for every sender.
+
+    The fan-out sends from FANOUT_WORKERS threads and the outbox from the
+    polling thread; with the default pool of one connection every other
+    concurrent send would open and then discard its own connection.
+    """
+    return telegram.Bot(
+        token=TELEGRAM_TOKEN,
+        request=Request(con_pool_size=FANOUT_WORKERS + 1)
+    )
+
+
+def make_fanout(bot):
+    """This function subscribes TELEGRAM_CHAT_ID and the fan-out chats.
+
+    TELEGRAM_FANOUT_CHAT_IDS lists extra chats as `chat_id[:locale]`
+    separated by commas.
+    """
+    fanout = FanOut(bot, RENDERERS, DIGEST_HEADERS)
+    fanout.subscribe(TELEGRAM_CHAT_ID)
+    for item in filter(None, FANOUT_CHAT_IDS.split(',')):
+        chat_id, _, locale = item.strip().partition(':')
+        fanout.subscribe(chat_id, locale or DEFAULT_LOCALE)
+    return fanout
+
+
+def publish(fanout, digest, homeworks):
+    """This function sends transitions at once or buffers them."""
+    for homework in homeworks:
+        if digest is None:
+            fanout.publish(homework)
+        else:
+            digest.add(TELEGRAM_CHAT_ID, homework)
+
+
+def flush_digest(fanout, digest):
+    """This function sends the buffered transitions when they fall due."""
+    if digest is None:
+        return
+    for _, batch in digest.due():
+        try:
+            fanout.publish_many(batch)
+        except Exception as error:
+            logger.error(f'Failed to send digest, reason: {error}')
+
+
+def send_error_message(outbox, incidents, error):
+    """Sending details of errors occurred to telegram."""
+    message = incidents.failure(error, TELEGRAM_CHAT_ID)
+    if message is not None:
+        outbox.put_error(TELEGRAM_CHAT_ID, error, message)
+
+
+def send_recovery_message(outbox, incidents):
+    """Telling telegram that errors occurred earlier are gone."""
+    for message in incidents.success(TELEGRAM_CHAT_ID):
+        outbox.put_error(TELEGRAM_CHAT_ID, None, message)
+
+
+class Worker:
+    """The polling loop of main() and everything it sends with."""
+
+    def __init__(self, bot):
+        """This function creates the outbox, fan-out and gauges.
+
+        The window, with the transitions it has seen but not yet sent, is
+        restored from WINDOW_FILE when it is set. Otherwise it starts
+        LOOKBACK seconds ago, so that changes made between the last poll
+        before a restart and the restart are not skipped.
+        """
+        self.bot = bot
+        self.lock = threading.Lock()
+        self.outbox = Outbox()
+        self.fanout = make_fanout(bot)
+        self.incidents = ErrorAggregator()
+        self.digest = (
+            Digest(DIGEST_WINDOW, DIGEST_SIZE) if DIGEST_WINDOW else None
+        )
+        self.subscription = Subscription(
+            PRACTICUM_TOKEN, TELEGRAM_CHAT_ID, int(time.time()) - LOOKBACK
+        )
+        if WINDOW_FILE:
+            load_state(self, WINDOW_FILE)
+        self.health = Health(gauges={
+            'last_send': self.last_send,
+            'outbox': lambda: len(self.outbox),
+            'pending': self.fanout.pending,
+            'digest': lambda: (
+                0 if self.digest is None else len(self.digest)
+            ),
+            'window_behind': lambda: self.subscription.window.behind,
+            'incidents': lambda: [
+                {**incident, 'since': timestamp(incident['since'])}
+                for incident in self.incidents.snapshot()
+            ],
+        })
+
+    def dump(self):
+        """This function returns the window and unsent transitions."""
+        return {
+            'window': self.subscription.window.dump(),
+            'digest': [] if self.digest is None else self.digest.dump(),
+            'pending': self.fanout.dump(),
+        }
+
+    def load(self, data):
+        """This function restores the state returned by `dump()`.
+
+        Buffered digests are queued for the next poll if digest mode has
+        been switched off since.
+        """
+        self.subscription.window.load(data['window'])
+        self.fanout.load(data['pending'])
+        if self.digest is not None:
+            self.digest.load(data['digest'])
+        else:
+            for _, _, homeworks in data['digest']:
+                self.fanout.defer(homeworks)
+
+    def save(self):
+        """This function saves the state to WINDOW_FILE if it is set."""
+        if WINDOW_FILE:
+            save_state(self, WINDOW_FILE)
+
+    def last_send(self):
+        """This function returns when a message was last delivered."""
+        times = [self.outbox.last_delivered] + [
+            recipient.last_delivered
+            for recipient in self.fanout.recipients.values()
+        ]
+        times = [value for value in times if value is not None]
+        return timestamp(max(times)) if times else None
+
+    def poll(self, current=None):
+        """This function checks homeworks once and sends the news.
+
+        `current()` tells whether this thread still is the polling loop.
+        Everything after the request runs under `lock`, and once the
+        watchdog has replaced the thread its late response is discarded
+        and nothing is sent.
+        """
+        current = current or (lambda: True)
+        try:
+            response = fetch_subscription(self.subscription)
+            with self.lock:
+                if not current():
+                    raise ReplacedError('the poller was replaced')
+                publish(
+                    self.fanout, self.digest,
+                    advance_subscription(self.subscription, response)
+                )
+                self.health.polled()
+                send_recovery_message(self.outbox, self.incidents)
+
+        except ReplacedError as error:
+            logging.warning(f'Discarding the poll: {error}')
+        except NoHomeworksError as error:
+            logging.debug(error)
+        except LoggedOnlyError as error:
+            message = f'Сбой в работе программы: {error}'
+            logging.error(message)
+        except Exception as error:
+            logging.error(error)
+            if current():
+                send_error_message(self.outbox, self.incidents, error)
+        finally:
+            with self.lock:
+                if current():
+                    self.fanout.retry()
+                    flush_digest(self.fanout, self.digest)
+                    deliver(self.bot, self.outbox)
+                    self.save()
+            profiling.maybe_dump()
+
+    def wait(self, until, current=None):
+        """This function sleeps until `until`, sending digests when due.
+
+        `until` is a time.monotonic() value.
+        """
+        current = current or (lambda: True)
+        while True:
+            wake = until
+            if self.digest is not None:
+                wake = min(until, self.digest.next_deadline() or until)
+            time.sleep(max(0, wake - time.monotonic()))
+            if wake >= until:
+                return
+            with self.lock:
+                if not current():
+                    return
+                flush_digest(self.fanout, self.digest)
+                self.save()
+
+    def poll_forever(self, component, generation):
+        """This function polls every RETRY_TIME until replaced."""
+        def current():
+            return component.generation == generation
+
+        while component.beat(generation):
+            self.poll(current)
+            if not self.subscription.window.behind:
+                self.wait(time.monotonic() + RETRY_TIME, current)
+
+
 def check_tokens():
     """This function checks whether all tokens are present."""
     return all([PRACTICUM_TOKEN, TELEGRAM_TOKEN, TELEGRAM_CHAT_ID])
@@ -103,50 +449,18 @@ def main():
         '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     )
     handler.setFormatter(formatter)
-    bot = telegram.Bot(token=TELEGRAM_TOKEN)
+    bot = make_bot()
     if not check_tokens():
         logger.critical('No tokens found')
         sys.exit()
-
-    previous_message = None
-
-    def send_error_message(error, previous_message):
-        """Sending details of errors occurred to telegram."""
-        message = f'Сбой в работе программы: {error}'
-        if message != previous_message:
-            previous_message = message
-            bot.send_message(TELEGRAM_CHAT_ID, message)
-
-    def get_checked_answer(current_timestamp):
-        """Enabling first functions in main."""
-        response = get_api_answer(current_timestamp)
-        homeworks = check_response(response)
-        homework = homeworks[0]
-        return response, homework
-
-    current_timestamp = int(time.time())
-
-    while True:
-
-        try:
-            current_timestamp = current_timestamp or int(time.time())
-            response, homework = get_checked_answer(current_timestamp)
-            message = parse_status(homework)
-            current_timestamp = response.get('current_date')
-            if message != previous_message:
-                previous_message = message
-                bot.send_message(TELEGRAM_CHAT_ID, message)
-
-        except NoHomeworksError as error:
-            logging.debug(error)
-        except LoggedOnlyError as error:
-            message = f'Сбой в работе программы: {error}'
-            logging.error(message)
-        except Exception as error:
-            logging.error(error)
-            send_error_message(error)
-        finally:
-            time.sleep(RETRY_TIME)
+    profiling.install()
+    worker = Worker(bot)
+    poller = Component('poller', worker.poll_forever, STALL_TIMEOUT)
+    worker.health.components.append(poller)
+    if HEALTH_PORT:
+        serve_health(worker.health, int(HEALTH_PORT))
+    poller.start()
+    Watchdog([poller]).run()
 
 
 if __name__ == '__main__':
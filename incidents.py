@@ -0,0 +1,106 @@
+import re
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+
+import requests
+
+from lru import LRUCache
+
+WINDOW = 60 * 60
+MAX_INCIDENTS = 100
+ADDRESS = re.compile(r'0x[0-9a-fA-F]+')
+QUERY = re.compile(r'\?[^\s\'")]*')
+
+
+def fingerprint(error):
+    """This function identifies repeats of the same failure.
+
+    Request errors are told apart by type and host only: their messages
+    carry the URL with the `from_date` of each subscription.
+    """
+    request = getattr(error, 'request', None)
+    if isinstance(error, requests.RequestException) and request is not None:
+        return type(error).__name__, urlsplit(request.url).hostname
+    return type(error).__name__, QUERY.sub('?', ADDRESS.sub('0x', str(error)))
+
+
+class Incident:
+    """Repeated failures sharing a fingerprint."""
+
+    def __init__(self, error, now):
+        """This function opens an incident at the failure."""
+        self.error = error
+        self.since = now
+        self.window_started = now
+        self.count = 1
+        self.folded = 0
+        self.keys = set()
+
+
+class ErrorAggregator:
+    """Folds repeated failures into periodic summaries.
+
+    The first failure of a kind is reported at once; repeats within
+    `window` seconds are counted and reported as one summary with the
+    next failure after the window. When every subscription (`key`) that
+    failed has succeeded again a recovery notice is produced. At most
+    `max_incidents` kinds of failures are tracked.
+    """
+
+    def __init__(self, window=WINDOW, max_incidents=MAX_INCIDENTS):
+        """This function creates an aggregator with no incidents."""
+        self.window = window
+        self.incidents = LRUCache(max_incidents)
+        self.lock = threading.Lock()
+
+    def failure(self, error, key=None, now=None):
+        """This function records a failure and returns a notice or None."""
+        now = time.time() if now is None else now
+        with self.lock:
+            incident = self.incidents.get(fingerprint(error))
+            if incident is None:
+                incident = Incident(error, now)
+                incident.keys.add(key)
+                self.incidents[fingerprint(error)] = incident
+                return f'Сбой в работе программы: {error}'
+            incident.keys.add(key)
+            incident.count += 1
+            incident.folded += 1
+            if now - incident.window_started < self.window:
+                return None
+            folded = incident.folded
+            incident.folded = 0
+            incident.window_started = now
+        return (
+            f'Сбой в работе программы: {error}. '
+            f'Сбоев с {datetime.fromtimestamp(incident.since):%H:%M}: '
+            f'{incident.count} (повторов за окно: {folded})'
+        )
+
+    def snapshot(self):
+        """This function lists the open incidents, oldest first."""
+        with self.lock:
+            return [
+                {'error': str(incident.error), 'count': incident.count,
+                 'since': incident.since}
+                for incident in self.incidents.values()
+            ]
+
+    def success(self, key=None):
+        """This function returns recovery notices for the subscription."""
+        notices = []
+        with self.lock:
+            for code, incident in list(self.incidents.items()):
+                incident.keys.discard(key)
+                if incident.keys:
+                    continue
+                del self.incidents[code]
+                notices.append(
+                    f'Работа программы восстановлена после сбоя: '
+                    f'{incident.error}. Сбоев с '
+                    f'{datetime.fromtimestamp(incident.since):%H:%M}: '
+                    f'{incident.count}'
+                )
+        return notices
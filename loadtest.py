@@ -0,0 +1,382 @@
+"""Capacity planning for the polling worker.
+
+Usage: python loadtest.py --subscriptions 100 --concurrency 1,4,16
+       python loadtest.py --benchmark --sizes 10,100,1000 --workers 16
+       python loadtest.py --digest --digest-window 300 [--trace trace.jsonl]
+"""
+import argparse
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import threading
+import time
+
+import requests
+
+import digest
+import homework
+from dispatch import Outbox
+from exceptions import OutboxFullError
+from fakes import FakeBot, parse_date, serve_upstream
+from fanout import RATE, FanOut
+from pool import WORKERS, ThreadedPoller
+
+logger = logging.getLogger(__name__)
+
+
+def rss_bytes():
+    """This function returns the resident set size of the process."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentile(values, fraction):
+    """This function returns the nearest-rank percentile of values."""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def make_subscriptions(count):
+    """This function creates synthetic subscriptions."""
+    return [
+        homework.Subscription(f'loadtest-{number}', number)
+        for number in range(count)
+    ]
+
+
+class Counters:
+    """Measurements collected by one thread."""
+
+    def __init__(self):
+        """This function zeroes the counters."""
+        self.polls = 0
+        self.sends = 0
+        self.errors = 0
+        self.lags = []
+
+
+def poll_shard(shard, fanout, outbox, deadline, counters):
+    """This function polls a shard of subscriptions until the deadline.
+
+    Transitions are sent through the fan-out as the bot sends them, so
+    the poll waits for the send and its rate limit. The deadline is
+    checked before every subscription, so a saturated stage still ends
+    on time.
+    """
+    session = requests.Session()
+    for subscription in itertools.cycle(shard):
+        if time.monotonic() >= deadline:
+            break
+        try:
+            changed = homework.poll_subscription(subscription, session)
+        except Exception as error:
+            counters.errors += 1
+            outbox.put_error(
+                subscription.chat_id, error,
+                f'Сбой в работе программы: {error}'
+            )
+            continue
+        counters.polls += 1
+        recipient = fanout.recipients[subscription.chat_id]
+        for item in changed:
+            texts = fanout.render([item], [recipient])[recipient.locale]
+            if fanout.send_all(recipient, texts):
+                counters.sends += 1
+                counters.lags.append(
+                    time.time() - parse_date(item['date_updated'])
+                )
+    session.close()
+
+
+def send_outbox(outbox, bot, deadline):
+    """This function delivers error notices until the deadline."""
+    while time.monotonic() < deadline:
+        message = outbox.pop()
+        if message is None:
+            time.sleep(0.001)
+            continue
+        bot.send_message(message.chat_id, message.text)
+        outbox.delivered(message)
+
+
+def run_stage(subscriptions, workers, duration, bot, rate=RATE):
+    """This function runs one concurrency stage and returns its report."""
+    shards = [subscriptions[number::workers] for number in range(workers)]
+    counters = [Counters() for _ in shards]
+    fanout = FanOut(bot, homework.RENDERERS, workers=1, rate=rate)
+    for subscription in subscriptions:
+        fanout.subscribe(subscription.chat_id)
+    outbox = Outbox()
+    deadline = time.monotonic() + duration
+    threads = [
+        threading.Thread(
+            target=poll_shard,
+            args=(shard, fanout, outbox, deadline, item)
+        )
+        for shard, item in zip(shards, counters)
+    ]
+    threads.append(threading.Thread(
+        target=send_outbox, args=(outbox, bot, deadline)
+    ))
+    cpu, started = time.process_time(), time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+    cpu = time.process_time() - cpu
+    fanout.close()
+    polls = sum(item.polls for item in counters)
+    sends = sum(item.sends for item in counters)
+    return {
+        'workers': workers,
+        'polls': polls,
+        'sends': sends,
+        'errors': sum(item.errors for item in counters),
+        'backlog': sum(
+            len(recipient.pending)
+            for recipient in fanout.recipients.values()
+        ),
+        'polls_per_s': polls / elapsed,
+        'sends_per_s': sends / elapsed,
+        'p99_lag_s': percentile(
+            [lag for item in counters for lag in item.lags], 0.99
+        ),
+        'error_notices': outbox.stats()['error'],
+        'cpu_s_per_poll': cpu / polls if polls else None,
+        'rss_bytes': rss_bytes(),
+        'fresh': polls / elapsed >= len(subscriptions) / homework.RETRY_TIME,
+    }
+
+
+def run(endpoint, subscriptions, concurrency, duration, send_latency=0.0,
+        rate=RATE):
+    """This function ramps concurrency against the endpoint."""
+    baseline = rss_bytes()
+    homework.ENDPOINT = endpoint
+    items = make_subscriptions(subscriptions)
+    bot = FakeBot(send_latency)
+    stages = []
+    for workers in concurrency:
+        stage = run_stage(
+            items, min(workers, subscriptions), duration, bot, rate
+        )
+        stage['rss_bytes_per_subscription'] = (
+            (stage.pop('rss_bytes') - baseline) / subscriptions
+        )
+        logger.info(
+            f'{workers} workers: {stage["polls_per_s"]:.1f} polls/s, '
+            f'{stage["sends_per_s"]:.1f} sends/s, '
+            f'p99 lag {stage["p99_lag_s"]}, backlog {stage["backlog"]}'
+        )
+        stages.append(stage)
+    return {
+        'subscriptions': subscriptions,
+        'duration_s': duration,
+        'send_latency_s': send_latency,
+        'send_rate': rate,
+        'required_polls_per_s': subscriptions / homework.RETRY_TIME,
+        'stages': stages,
+    }
+
+
+def serial_cycle(subscriptions, bot, session):
+    """This function polls every subscription one by one, then sends.
+
+    Nothing sends while the cycle polls, so a full outbox is drained at
+    once instead of waiting for room.
+    """
+    outbox = Outbox()
+    for subscription in subscriptions:
+        try:
+            for item in homework.poll_subscription(subscription, session):
+                message = homework.parse_status(item)
+                try:
+                    outbox.put_status(subscription.chat_id, message, 0)
+                except OutboxFullError:
+                    outbox.drain(bot.send_message)
+                    outbox.put_status(subscription.chat_id, message, 0)
+        except Exception as error:
+            outbox.put_error(
+                subscription.chat_id, error,
+                f'Сбой в работе программы: {error}'
+            )
+    outbox.drain(bot.send_message)
+
+
+def pool_cycle(poller):
+    """This function polls every subscription in the pool, then sends."""
+    poller.poll_once()
+    while len(poller.outbox):
+        time.sleep(0.001)
+
+
+def benchmark(endpoint, sizes, workers=WORKERS, send_latency=0.0):
+    """This function compares one serial and one pooled polling cycle."""
+    homework.ENDPOINT = endpoint
+    results = []
+    for size in sizes:
+        bot = FakeBot(send_latency)
+        with requests.Session() as session:
+            started = time.monotonic()
+            serial_cycle(make_subscriptions(size), bot, session)
+            serial = time.monotonic() - started
+        poller = ThreadedPoller(make_subscriptions(size), bot, workers)
+        poller.sender.start()
+        started = time.monotonic()
+        pool_cycle(poller)
+        pooled = time.monotonic() - started
+        poller.stop()
+        logger.info(
+            f'{size} subscriptions: serial {serial:.3f}s, '
+            f'pool {pooled:.3f}s'
+        )
+        results.append({
+            'subscriptions': size,
+            'serial_cycle_s': serial,
+            'pool_cycle_s': pooled,
+            'speedup': serial / pooled,
+        })
+    return {
+        'workers': workers,
+        'send_latency_s': send_latency,
+        'sizes': results,
+    }
+
+
+def burst_trace(chats=100, bursts=5, burst_size=8, spread=120, seed=0):
+    """This function makes a day of bursty `(time, chat_id, text)` events.
+
+    Every chat gets `bursts` bursts of up to `burst_size` transitions
+    within `spread` seconds, as when a reviewer checks a cohort at once.
+    """
+    generator = random.Random(seed)
+    events = []
+    for chat_id in range(chats):
+        for _ in range(bursts):
+            started = generator.uniform(0, 24 * 60 * 60)
+            for number in range(generator.randint(1, burst_size)):
+                events.append((
+                    started + generator.uniform(0, spread), chat_id,
+                    homework.parse_status({
+                        'homework_name': f'hw{number}.zip',
+                        'status': generator.choice(
+                            list(homework.REVIEWER_REPLY)
+                        ),
+                    })
+                ))
+    return sorted(events)
+
+
+def read_trace(path):
+    """This function reads JSON lines with `time`, `chat_id` and `text`."""
+    with open(path) as file:
+        events = [json.loads(line) for line in file if line.strip()]
+    return sorted(
+        (event['time'], event['chat_id'], event['text']) for event in events
+    )
+
+
+def numbers(value):
+    """This function parses a comma separated list of integers."""
+    return [int(item) for item in value.split(',')]
+
+
+def parse_args(argv):
+    """This function parses command line arguments."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--subscriptions', type=int, default=100)
+    parser.add_argument(
+        '--concurrency', default='1,2,4,8', type=numbers,
+        help='comma separated worker counts to ramp through'
+    )
+    parser.add_argument('--benchmark', action='store_true',
+                        help='compare the serial loop with ThreadedPoller')
+    parser.add_argument('--sizes', default='10,100,1000', type=numbers,
+                        help='comma separated subscription counts to compare')
+    parser.add_argument('--workers', type=int, default=WORKERS,
+                        help='ThreadedPoller workers in the benchmark')
+    parser.add_argument('--duration', type=float, default=5.0,
+                        help='seconds per stage')
+    parser.add_argument('--change-interval', type=float, default=2.0,
+                        help='seconds between upstream status changes')
+    parser.add_argument('--send-latency', type=float, default=0.0,
+                        help='seconds every fake Telegram send takes')
+    parser.add_argument('--send-rate', type=float, default=RATE,
+                        help='fan-out sends per second, as RATE in the bot')
+    parser.add_argument('--upstream-latency', type=float, default=0.0,
+                        help='seconds every fake upstream reply takes')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='share of upstream requests failing with 500')
+    parser.add_argument('--digest', action='store_true',
+                        help='replay a burst trace through digest mode')
+    parser.add_argument('--digest-window', type=float, default=300,
+                        help='seconds a digest may hold a message')
+    parser.add_argument('--digest-size', type=int, default=digest.SIZE,
+                        help='messages that flush a digest at once')
+    parser.add_argument('--trace',
+                        help='JSON lines trace to replay, synthetic if unset')
+    parser.add_argument('--report', help='path to write the JSON report to')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """This function runs the load test against a fake upstream."""
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    args = parse_args(argv)
+    if args.digest:
+        events = read_trace(args.trace) if args.trace else burst_trace()
+        write_report(
+            digest.replay(events, args.digest_window, args.digest_size),
+            args.report
+        )
+        return
+    connection, child = multiprocessing.Pipe()
+    upstream = multiprocessing.Process(
+        target=serve_upstream,
+        args=(
+            child, args.change_interval, args.error_rate,
+            args.upstream_latency
+        ),
+        daemon=True
+    )
+    upstream.start()
+    try:
+        if args.benchmark:
+            report = benchmark(
+                connection.recv(), args.sizes, args.workers,
+                args.send_latency
+            )
+        else:
+            report = run(
+                connection.recv(), args.subscriptions, args.concurrency,
+                args.duration, args.send_latency, args.send_rate
+            )
+    finally:
+        connection.send(None)
+        upstream.join()
+    write_report(report, args.report)
+
+
+def write_report(report, path=None):
+    """This function writes the JSON report to the path or stdout."""
+    if path:
+        with open(path, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,24 @@
+from collections import OrderedDict
+
+
+class LRUCache(OrderedDict):
+    """OrderedDict keeping at most `maxsize` recently used items."""
+
+    def __init__(self, maxsize):
+        """This function creates an empty cache."""
+        super().__init__()
+        self.maxsize = maxsize
+
+    def get(self, key, default=None):
+        """This function returns the value and marks it recently used."""
+        if key not in self:
+            return default
+        self.move_to_end(key)
+        return self[key]
+
+    def __setitem__(self, key, value):
+        """This function stores the item, evicting the oldest."""
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        if len(self) > self.maxsize:
+            self.popitem(last=False)
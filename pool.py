@@ -0,0 +1,141 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+from telegram.error import TelegramError
+
+from dispatch import Outbox
+from exceptions import OutboxFullError
+from fanout import UNDELIVERABLE
+from homework import (
+    RETRY_TIME, TELEGRAM_CHAT_ID, parse_status, poll_subscription
+)
+from incidents import ErrorAggregator
+
+WORKERS = 8
+MAX_OUTBOX = 1000
+logger = logging.getLogger(__name__)
+
+
+class ThreadedPoller:
+    """Polls many subscriptions in parallel with a pooled session.
+
+    At most `2 * workers` polls are queued at once, and no new polls are
+    submitted while more than `max_outbox` messages wait to be sent;
+    running polls wait for room in the outbox. Failures of all
+    subscriptions are folded by one ErrorAggregator, and its incident and
+    recovery notices go to `operator_chat_id`, not to the subscriptions'
+    chats.
+
+    Only `loadtest.py --benchmark` runs it; main() polls its single
+    subscription itself. Transitions are sent as `parse_status` text to
+    the subscription's own chat, without the fan-out or the digest.
+    """
+
+    def __init__(self, subscriptions, bot, workers=WORKERS,
+                 max_outbox=MAX_OUTBOX, retry_time=RETRY_TIME,
+                 operator_chat_id=TELEGRAM_CHAT_ID):
+        """This function sets up the session, pool and sender."""
+        self.subscriptions = subscriptions
+        self.bot = bot
+        self.operator_chat_id = operator_chat_id
+        self.max_outbox = max_outbox
+        self.retry_time = retry_time
+        self.outbox = Outbox(max_statuses=max_outbox)
+        self.incidents = ErrorAggregator()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(
+            workers, thread_name_prefix='poller'
+        )
+        self.slots = threading.BoundedSemaphore(2 * workers)
+        self.stopping = threading.Event()
+        self.sender = threading.Thread(
+            target=self.send_forever, name='sender', daemon=True
+        )
+
+    def poll(self, subscription):
+        """This function polls one subscription and queues its messages."""
+        try:
+            if self.stopping.is_set():
+                return
+            for homework in poll_subscription(subscription, self.session):
+                self.outbox.put_status(
+                    subscription.chat_id, parse_status(homework)
+                )
+            for message in self.incidents.success(subscription.chat_id):
+                self.outbox.put_error(self.operator_chat_id, None, message)
+        except OutboxFullError:
+            logger.warning('Outbox closed, dropping the poll')
+        except Exception as error:
+            logger.error(error)
+            message = self.incidents.failure(error, subscription.chat_id)
+            if message is not None:
+                self.outbox.put_error(self.operator_chat_id, error, message)
+        finally:
+            self.slots.release()
+
+    def acquire(self):
+        """This function waits for room in the pool and in the outbox."""
+        while not self.stopping.is_set():
+            if len(self.outbox) < self.max_outbox:
+                if self.slots.acquire(timeout=0.1):
+                    return True
+            else:
+                self.stopping.wait(0.01)
+        return False
+
+    def poll_once(self):
+        """This function polls every subscription once."""
+        futures = []
+        for subscription in self.subscriptions:
+            if not self.acquire():
+                break
+            futures.append(self.executor.submit(self.poll, subscription))
+        wait(futures)
+
+    def send_forever(self):
+        """This function sends queued messages until stopped."""
+        while not self.stopping.is_set():
+            message = self.outbox.pop()
+            if message is None:
+                self.stopping.wait(0.01)
+                continue
+            try:
+                self.bot.send_message(message.chat_id, message.text)
+            except UNDELIVERABLE as error:
+                logger.error(
+                    f'Dropping message to {message.chat_id}, reason: {error}'
+                )
+                self.outbox.drop(message)
+                continue
+            except TelegramError as error:
+                logger.error(f'Failed to send message, reason: {error}')
+                if not self.outbox.requeue(message):
+                    logger.error(
+                        f'Dropping message to {message.chat_id} after '
+                        f'{message.attempts} attempts'
+                    )
+                self.stopping.wait(1)
+                continue
+            self.outbox.delivered(message)
+
+    def run(self):
+        """This function polls every `retry_time` seconds until stopped."""
+        self.sender.start()
+        while not self.stopping.is_set():
+            self.poll_once()
+            self.stopping.wait(self.retry_time)
+
+    def stop(self):
+        """This function skips pending polls and stops the sender."""
+        self.stopping.set()
+        self.outbox.close()
+        self.executor.shutdown(wait=True)
+        if self.sender.is_alive():
+            self.sender.join()
+        self.session.close()
@@ -0,0 +1,152 @@
+"""Opt-in profiling of the polling pipeline.
+
+PROFILE_STAGES=1 times every stage; the summary is logged every
+PROFILE_DUMP_INTERVAL seconds and on the next `maybe_dump()` call after
+SIGUSR2. SIGUSR1 (or PROFILE_SAMPLER=1 at start) toggles cProfile and
+tracemalloc on the next `maybe_dump()` call, so the polling thread is the
+one profiled; their top entries are logged when switched off. The signal
+handlers only set flags: logging from a handler could deadlock on the
+logging lock held by the interrupted thread. With PROFILE_STAGES unset the
+decorated functions are left untouched and `stage()` returns a shared no-op
+context manager.
+"""
+import cProfile
+import functools
+import io
+import logging
+import os
+import pstats
+import signal
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+STAGES = bool(os.getenv('PROFILE_STAGES'))
+SAMPLER = bool(os.getenv('PROFILE_SAMPLER'))
+DUMP_INTERVAL = int(os.getenv('PROFILE_DUMP_INTERVAL', 3600))
+TOP = 20
+logger = logging.getLogger(__name__)
+
+_timings = {}
+_lock = threading.Lock()
+_disabled = nullcontext()
+_profiler = None
+_toggle_requested = False
+_dump_requested = False
+_last_dump = time.monotonic()
+
+
+def record(name, elapsed):
+    """This function adds one measurement of a stage."""
+    with _lock:
+        count, total, longest = _timings.get(name, (0, 0.0, 0.0))
+        _timings[name] = (count + 1, total + elapsed, max(longest, elapsed))
+
+
+@contextmanager
+def _timer(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+
+
+def stage(name):
+    """This function returns a context manager timing the stage."""
+    if not STAGES:
+        return _disabled
+    return _timer(name)
+
+
+def timed(name):
+    """This decorator times every call of the function as a stage."""
+    def decorator(func):
+        if not STAGES:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _timer(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def summary():
+    """This function describes the stages measured so far."""
+    with _lock:
+        timings = sorted(_timings.items(), key=lambda item: -item[1][1])
+    return '\n'.join(
+        f'{name}: {count} calls, {total:.3f}s total, '
+        f'{total / count * 1000:.2f}ms mean, {longest * 1000:.2f}ms max'
+        for name, (count, total, longest) in timings
+    )
+
+
+def dump():
+    """This function logs the stage summary."""
+    global _last_dump, _dump_requested
+    _last_dump = time.monotonic()
+    _dump_requested = False
+    if _timings:
+        logger.info(f'Stage timings:\n{summary()}')
+
+
+def maybe_dump():
+    """This function logs the summary once per DUMP_INTERVAL or on request."""
+    global _toggle_requested
+    if _toggle_requested:
+        _toggle_requested = False
+        toggle_sampler()
+    if _dump_requested or (
+        STAGES and time.monotonic() - _last_dump >= DUMP_INTERVAL
+    ):
+        dump()
+
+
+def request_dump(signum=None, frame=None):
+    """This function asks the polling thread to log the summary."""
+    global _dump_requested
+    _dump_requested = True
+
+
+def request_toggle(signum=None, frame=None):
+    """This function asks the polling thread to toggle the sampler."""
+    global _toggle_requested
+    _toggle_requested = True
+
+
+def toggle_sampler():
+    """This function starts or stops cProfile and tracemalloc."""
+    global _profiler
+    if _profiler is None:
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+        tracemalloc.start()
+        logger.info('Profiler started')
+        return
+    _profiler.disable()
+    stream = io.StringIO()
+    pstats.Stats(_profiler, stream=stream).sort_stats(
+        'cumulative'
+    ).print_stats(TOP)
+    allocations = tracemalloc.take_snapshot().statistics('lineno')[:TOP]
+    tracemalloc.stop()
+    _profiler = None
+    logger.info(f'Profiler stopped\n{stream.getvalue()}')
+    logger.info('Top allocations:\n' + '\n'.join(map(str, allocations)))
+
+
+def install():
+    """This function registers the signal handlers."""
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, request_toggle)
+        signal.signal(signal.SIGUSR2, request_dump)
+    if SAMPLER and _profiler is None:
+        request_toggle()
@@ -0,0 +1,80 @@
+import time
+
+import homework
+import loadtest
+from digest import HEADER, Digest, render_digest, replay
+from fakes import FakeBot
+from fanout import FanOut
+
+
+class TestDigest:
+
+    def test_flushes_on_size_or_window(self):
+        digest = Digest(window=60, size=3)
+        digest.add(1, 'a', now=0)
+        digest.add(1, 'b', now=10)
+        digest.add(2, 'c', now=30)
+        assert digest.due(now=50) == []
+        assert digest.next_deadline() == 60
+        digest.add(1, 'd', now=55)
+        assert digest.due(now=55) == [(1, ['a', 'b', 'd'])]
+        assert digest.due(now=90) == [(2, ['c'])]
+        assert digest.next_deadline() is None
+
+    def test_render_respects_message_limit(self):
+        assert render_digest(['only']) == ['only']
+        messages = render_digest(['x' * 40] * 5, limit=130)
+        assert len(messages) == 3
+        assert all(message.startswith(HEADER) for message in messages)
+        assert all(len(message) <= 130 for message in messages)
+
+    def test_replay_reduces_sends_within_window(self):
+        events = loadtest.burst_trace(chats=20, bursts=3, seed=1)
+        report = replay(events, window=300, size=10)
+        assert report['messages'] == len(events)
+        assert report['sends'] < report['messages']
+        assert report['max_delay_s'] <= 300 + 1e-6
+
+    def test_fanout_sends_one_digest(self):
+        bot = FakeBot()
+        fanout = FanOut(bot, {'ru': lambda homework: homework['name']})
+        fanout.subscribe(1)
+        report = fanout.publish_many([{'name': 'a'}, {'name': 'b'}])
+        fanout.close()
+        assert report['sent'] == 1
+        assert bot.sent == 1
+
+    def test_digest_header_follows_the_locale(self):
+        texts = []
+        bot = FakeBot()
+        bot.send_message = lambda chat_id, text: texts.append(text)
+
+        def name(homework):
+            return homework['name']
+
+        fanout = FanOut(bot, {'ru': name, 'en': name}, {'en': 'Changed:'})
+        fanout.subscribe(1, 'en')
+        fanout.publish_many([{'name': 'a'}, {'name': 'b'}])
+        fanout.close()
+        assert texts == ['Changed:\n— a\n— b']
+
+    def test_len_counts_buffered_items(self):
+        digest = Digest(window=60, size=10)
+        digest.add(1, 'a', now=0)
+        digest.add(1, 'b', now=0)
+        digest.add(2, 'c', now=0)
+        assert len(digest) == 3
+        digest.due(now=60)
+        assert len(digest) == 0
+
+    def test_worker_sends_digest_between_polls(self, monkeypatch):
+        monkeypatch.setattr(homework, 'TELEGRAM_CHAT_ID', 1)
+        worker = homework.Worker(FakeBot())
+        worker.digest = Digest(window=0.1)
+        worker.digest.add(1, {'homework_name': 'hw', 'status': 'approved'})
+        started = time.monotonic()
+        worker.wait(started + 0.3)
+        worker.fanout.close()
+        assert worker.bot.sent == 1
+        assert len(worker.digest) == 0
+        assert time.monotonic() - started >= 0.3
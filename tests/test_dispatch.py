@@ -0,0 +1,81 @@
+from dispatch import ERROR, STATUS, Outbox
+from exceptions import ApiNotRespondingError, NoHomeworksError
+
+
+class TestOutbox:
+
+    def test_statuses_go_before_errors(self):
+        outbox = Outbox()
+        outbox.put_error(1, ApiNotRespondingError(), 'error')
+        outbox.put_status(1, 'approved')
+        assert outbox.pop().priority == STATUS
+        assert outbox.pop().priority == ERROR
+        assert outbox.pop() is None
+
+    def test_errors_are_coalesced(self):
+        outbox = Outbox()
+        for _ in range(3):
+            outbox.put_error(1, ApiNotRespondingError(), 'error')
+        assert len(outbox) == 1
+        assert outbox.pop().repeats == 3
+
+    def test_no_homeworks_error_is_ignored(self):
+        outbox = Outbox()
+        outbox.put_error(1, NoHomeworksError(), 'empty')
+        assert len(outbox) == 0
+
+    def test_aged_errors_are_not_starved(self):
+        outbox = Outbox(max_error_wait=0)
+        outbox.put_error(1, ApiNotRespondingError(), 'first')
+        outbox.put_error(1, ApiNotRespondingError(), 'second')
+        for number in range(3):
+            outbox.put_status(1, str(number))
+        priorities = [outbox.pop().priority for _ in range(5)]
+        assert priorities == [ERROR, STATUS, ERROR, STATUS, STATUS]
+
+    def test_failed_send_is_requeued(self):
+        outbox = Outbox()
+        outbox.put_status(1, 'approved')
+
+        def send(chat_id, text):
+            raise ConnectionError
+
+        try:
+            outbox.drain(send)
+        except ConnectionError:
+            pass
+        assert len(outbox) == 1
+        sent = []
+        outbox.drain(lambda chat_id, text: sent.append(text))
+        assert sent == ['approved']
+        assert outbox.stats()[STATUS]['delivered'] == 1
+
+    def test_requeue_goes_behind_other_chats(self):
+        outbox = Outbox()
+        for chat_id, text in [(1, 'first'), (2, 'other'), (1, 'second')]:
+            outbox.put_status(chat_id, text)
+        outbox.requeue(outbox.pop())
+        texts = [outbox.pop().text for _ in range(3)]
+        assert texts == ['other', 'first', 'second']
+
+    def test_message_is_dropped_after_max_attempts(self):
+        outbox = Outbox(max_attempts=2)
+        outbox.put_status(1, 'approved')
+        assert outbox.requeue(outbox.pop())
+        assert not outbox.requeue(outbox.pop())
+        assert len(outbox) == 0
+        assert outbox.stats()[STATUS]['dropped'] == 1
+
+    def test_undeliverable_message_is_dropped(self):
+        outbox = Outbox()
+        outbox.put_status(1, 'approved')
+
+        def send(chat_id, text):
+            raise ValueError
+
+        try:
+            outbox.drain(send, undeliverable=ValueError)
+        except ValueError:
+            pass
+        assert len(outbox) == 0
+        assert outbox.stats()[STATUS]['dropped'] == 1
@@ -0,0 +1,139 @@
+import time
+
+import fanout
+import homework
+import profiling
+from fakes import FakeBot
+from fanout import FanOut
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+HOMEWORK = {'homework_name': 'hw123', 'status': 'approved'}
+
+
+class CountingRenderer:
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.calls = 0
+
+    def __call__(self, homework):
+        self.calls += 1
+        return f'{self.prefix} {homework["homework_name"]}'
+
+
+class BrokenBot(FakeBot):
+
+    def send_message(self, chat_id, text, **kwargs):
+        if chat_id == 'blocked':
+            raise BadRequest('Chat not found')
+        return super().send_message(chat_id, text, **kwargs)
+
+
+class FlakyBot(FakeBot):
+
+    def __init__(self):
+        super().__init__()
+        self.down = True
+
+    def send_message(self, chat_id, text, **kwargs):
+        if self.down:
+            raise NetworkError('Connection reset')
+        return super().send_message(chat_id, text, **kwargs)
+
+
+class FloodedBot(FakeBot):
+
+    def send_message(self, chat_id, text, **kwargs):
+        raise RetryAfter(0.05)
+
+
+class TestFanOut:
+
+    def test_ten_thousand_recipients_in_parallel(self):
+        renderers = {'ru': CountingRenderer('ru'), 'en': CountingRenderer('en')}
+        bot = FakeBot(latency=0.002, rate=5000)
+        fanout = FanOut(bot, renderers, workers=64, rate=4000)
+        for chat_id in range(10000):
+            fanout.subscribe(chat_id, 'en' if chat_id % 2 else 'ru')
+        started = time.monotonic()
+        report = fanout.publish(HOMEWORK)
+        elapsed = time.monotonic() - started
+        fanout.close()
+        assert report == {'sent': 10000, 'failed': 0, 'muted': 0,
+                          'rendered': 2}
+        assert renderers['ru'].calls == renderers['en'].calls == 1
+        assert len(bot.chats) == 10000
+        assert elapsed < 10000 * bot.latency / 2
+
+    def test_flood_control_is_retried(self):
+        bot = FakeBot(rate=200)
+        fanout = FanOut(bot, {'ru': CountingRenderer('ru')}, workers=16,
+                        rate=None)
+        for chat_id in range(300):
+            fanout.subscribe(chat_id)
+        report = fanout.publish(HOMEWORK)
+        fanout.close()
+        assert bot.rejected > 0
+        assert report['sent'] == 300
+        assert all(count == 1 for count in bot.chats.values())
+
+    def test_delivery_state_and_mute(self):
+        bot = BrokenBot()
+        fanout = FanOut(bot, {'ru': CountingRenderer('ru')}, backoff=0)
+        fanout.subscribe('blocked')
+        fanout.subscribe('mentor', 'unknown')
+        fanout.subscribe('muted')
+        fanout.mute('muted')
+        report = fanout.publish(HOMEWORK)
+        fanout.close()
+        assert report == {'sent': 1, 'failed': 1, 'muted': 1, 'rendered': 1}
+        assert fanout.recipients['mentor'].locale == 'ru'
+        assert fanout.recipients['mentor'].delivered == 1
+        assert fanout.recipients['blocked'].failed == 1
+        assert isinstance(fanout.recipients['blocked'].last_error, BadRequest)
+        assert 'muted' not in bot.chats
+
+    def test_flood_control_gives_up_after_flood_wait(self):
+        fanout = FanOut(FloodedBot(), {'ru': CountingRenderer('ru')},
+                        rate=None, flood_wait=0.2)
+        recipient = fanout.subscribe('flooded')
+        started = time.monotonic()
+        assert not fanout.send(recipient, 'text')
+        fanout.close()
+        assert time.monotonic() - started < 1
+        assert isinstance(recipient.last_error, RetryAfter)
+
+    def test_failed_texts_are_retried(self):
+        bot = FlakyBot()
+        fanout = FanOut(bot, {'ru': CountingRenderer('ru')}, retries=0,
+                        backoff=0)
+        recipient = fanout.subscribe('mentor')
+        assert fanout.publish(HOMEWORK)['failed'] == 1
+        assert list(recipient.pending) == ['ru hw123']
+        bot.down = False
+        fanout.publish({'homework_name': 'hw124', 'status': 'approved'})
+        assert fanout.retry() == {'sent': 0, 'failed': 0}
+        fanout.close()
+        assert bot.chats['mentor'] == 2
+        assert not recipient.pending
+
+    def test_rejected_chat_is_not_retried(self):
+        fanout = FanOut(BrokenBot(), {'ru': CountingRenderer('ru')})
+        recipient = fanout.subscribe('blocked')
+        fanout.publish(HOMEWORK)
+        fanout.close()
+        assert not recipient.pending
+
+    def test_sends_are_timed(self, monkeypatch):
+        monkeypatch.setattr(profiling, 'STAGES', True)
+        monkeypatch.setattr(profiling, '_timings', {})
+        fanout = FanOut(FakeBot(), {'ru': CountingRenderer('ru')})
+        fanout.subscribe('mentor')
+        fanout.publish(HOMEWORK)
+        fanout.close()
+        assert profiling._timings['telegram'][0] == 1
+
+    def test_bot_pool_fits_every_sender(self, monkeypatch):
+        monkeypatch.setattr(homework, 'TELEGRAM_TOKEN', '123:abc')
+        bot = homework.make_bot()
+        assert bot.request.con_pool_size > fanout.WORKERS
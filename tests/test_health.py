@@ -0,0 +1,145 @@
+import json
+import threading
+import time
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+from telegram.error import TelegramError
+
+import homework
+from fakes import FakeBot, FakeUpstream
+from health import Component, Health, Watchdog, dump_stacks, serve_health
+
+
+def get(server, path):
+    host, port = server.server_address[:2]
+    try:
+        with urlopen(f'http://{host}:{port}{path}') as response:
+            return response.status, json.loads(response.read())
+    except HTTPError as error:
+        return error.code, json.loads(error.read())
+
+
+class DownBot(FakeBot):
+
+    def send_message(self, chat_id, text, **kwargs):
+        raise TelegramError('Service unavailable')
+
+
+class TestWatchdog:
+
+    def test_stalled_component_is_replaced(self):
+        started = []
+        release = threading.Event()
+
+        def loop(component, generation):
+            started.append(generation)
+            if generation == 1:
+                release.wait(5)
+            while component.beat(generation):
+                time.sleep(0.01)
+
+        component = Component('loop', loop, stall_timeout=0.1)
+        component.start()
+        watchdog = Watchdog([component])
+        time.sleep(0.2)
+        watchdog.check()
+        assert component.restarts == 1
+        assert component.thread.name == 'loop-2'
+        release.set()
+        time.sleep(0.1)
+        assert not component.stalled()
+        assert started == [1, 2]
+        component.generation += 1
+
+    def test_dump_stacks_lists_threads(self):
+        assert 'MainThread' in dump_stacks()
+
+
+class TestHealth:
+
+    def test_endpoints(self):
+        component = Component(
+            'loop', lambda component, generation: None, stall_timeout=60
+        )
+        component.start()
+        health = Health([component], {'outbox': lambda: 3})
+        server = serve_health(health, 0, '127.0.0.1')
+        try:
+            status, report = get(server, '/ready')
+            assert status == 503
+            assert report['outbox'] == 3
+            health.components = []
+            health.polled()
+            status, report = get(server, '/ready')
+            assert status == 200
+            status, report = get(server, '/health')
+            assert status == 200
+            assert report['last_poll'] is not None
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_worker_reports_polls_and_sends(self, monkeypatch):
+        monkeypatch.setattr(homework, 'TELEGRAM_CHAT_ID', 1)
+        monkeypatch.setattr(homework, 'PRACTICUM_TOKEN', 'health')
+        with FakeUpstream(change_interval=60) as upstream:
+            monkeypatch.setattr(homework, 'ENDPOINT', upstream.endpoint)
+            worker = homework.Worker(FakeBot())
+            worker.subscription.window.mark = 0
+            worker.poll()
+        worker.fanout.close()
+        report = worker.health.report()
+        json.dumps(report)
+        assert report['last_poll'] is not None
+        assert report['last_send'] is not None
+        assert report['outbox'] == 0
+        assert report['pending'] == 0
+        assert report['incidents'] == []
+
+    def test_pending_transitions_are_reported(self, monkeypatch):
+        monkeypatch.setattr(homework, 'TELEGRAM_CHAT_ID', 1)
+        monkeypatch.setattr(homework, 'PRACTICUM_TOKEN', 'pending')
+        with FakeUpstream(change_interval=60) as upstream:
+            monkeypatch.setattr(homework, 'ENDPOINT', upstream.endpoint)
+            worker = homework.Worker(DownBot())
+            worker.subscription.window.mark = 0
+            worker.poll()
+        worker.fanout.close()
+        report = worker.health.report()
+        assert report['outbox'] == 0
+        assert report['pending'] == 1
+        assert report['last_send'] is None
+
+    def test_replaced_poller_discards_its_poll(self, monkeypatch):
+        monkeypatch.setattr(homework, 'TELEGRAM_CHAT_ID', 1)
+        monkeypatch.setattr(homework, 'PRACTICUM_TOKEN', 'replaced')
+        monkeypatch.setattr(homework, 'RETRY_TIME', 0.05)
+        release = threading.Event()
+        fetch = homework.fetch_subscription
+
+        def stuck_fetch(subscription, session=None):
+            if threading.current_thread().name == 'poller-1':
+                release.wait(5)
+            return fetch(subscription, session)
+
+        monkeypatch.setattr(homework, 'fetch_subscription', stuck_fetch)
+        with FakeUpstream(change_interval=60) as upstream:
+            monkeypatch.setattr(homework, 'ENDPOINT', upstream.endpoint)
+            worker = homework.Worker(FakeBot())
+            worker.subscription.window.mark = 0
+            component = Component('poller', worker.poll_forever, 0.2)
+            component.start()
+            stuck = component.thread
+            time.sleep(0.3)
+            Watchdog([component]).check()
+            time.sleep(0.3)
+            sent, mark = worker.bot.sent, worker.subscription.window.mark
+            assert sent > 0
+            release.set()
+            stuck.join(5)
+            assert not stuck.is_alive()
+            assert worker.bot.sent == sent
+            assert worker.subscription.window.mark == mark
+            component.generation += 1
+        worker.fanout.close()
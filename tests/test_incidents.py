@@ -0,0 +1,75 @@
+import socket
+
+import requests
+
+from exceptions import ApiNotRespondingError
+from incidents import ErrorAggregator, fingerprint
+
+
+def connection_error(from_date):
+    with socket.socket() as closed:
+        closed.bind(('127.0.0.1', 0))
+        port = closed.getsockname()[1]
+    try:
+        requests.get(
+            f'http://127.0.0.1:{port}/api/', params={'from_date': from_date}
+        )
+    except requests.ConnectionError as error:
+        return error
+
+
+class TestErrorAggregator:
+
+    def test_repeats_are_folded_into_a_summary(self):
+        incidents = ErrorAggregator(window=600)
+        error = ApiNotRespondingError('response code is 500')
+        assert incidents.failure(error, 1, now=0) == (
+            'Сбой в работе программы: response code is 500'
+        )
+        for now in (100, 200, 300):
+            assert incidents.failure(error, 1, now=now) is None
+        summary = incidents.failure(error, 1, now=600)
+        assert 'Сбоев с' in summary
+        assert ': 5 (повторов за окно: 4)' in summary
+        assert incidents.failure(error, 1, now=700) is None
+
+    def test_recovery_waits_for_every_subscription(self):
+        incidents = ErrorAggregator()
+        error = ConnectionError('<Connection object at 0x7f00>')
+        incidents.failure(error, 1)
+        incidents.failure(ConnectionError('<Connection object at 0x7f01>'), 2)
+        assert len(incidents.incidents) == 1
+        assert incidents.success(1) == []
+        notices = incidents.success(2)
+        assert len(notices) == 1
+        assert notices[0].startswith('Работа программы восстановлена')
+        assert incidents.success(2) == []
+
+    def test_state_is_bounded(self):
+        incidents = ErrorAggregator(max_incidents=3)
+        for code in range(10):
+            incidents.failure(ApiNotRespondingError(code), 1)
+        assert len(incidents.incidents) == 3
+
+    def test_fingerprint_keeps_type_and_message(self):
+        assert fingerprint(ValueError('a')) != fingerprint(TypeError('a'))
+        assert fingerprint(ValueError('a')) != fingerprint(ValueError('b'))
+
+    def test_request_errors_ignore_from_date(self):
+        first, second = connection_error(100), connection_error(200)
+        assert 'from_date=100' in str(first)
+        assert fingerprint(first) == fingerprint(second)
+        incidents = ErrorAggregator()
+        assert incidents.failure(first, 1) is not None
+        assert incidents.failure(second, 2) is None
+        assert len(incidents.incidents) == 1
+
+    def test_snapshot_copies_open_incidents(self):
+        incidents = ErrorAggregator()
+        incidents.failure(ApiNotRespondingError('response code is 500'), 1,
+                          now=0)
+        snapshot = incidents.snapshot()
+        incidents.success(1)
+        assert snapshot == [
+            {'error': 'response code is 500', 'count': 1, 'since': 0}
+        ]
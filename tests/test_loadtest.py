@@ -0,0 +1,66 @@
+import functools
+import threading
+import time
+
+import homework
+import loadtest
+from dispatch import Outbox
+from fakes import FakeBot, FakeUpstream
+
+
+class TestLoadtest:
+
+    def test_poll_subscription_reports_changes_once(self, monkeypatch):
+        with FakeUpstream(change_interval=60) as upstream:
+            monkeypatch.setattr(homework, 'ENDPOINT', upstream.endpoint)
+            subscription = homework.Subscription('token', 1)
+            changed = homework.poll_subscription(subscription)
+            assert [item['status'] for item in changed] == ['reviewing']
+            assert subscription.window.mark > 0
+            assert homework.poll_subscription(subscription) == []
+
+    def test_run_reports_every_stage(self, monkeypatch):
+        monkeypatch.setattr(homework, 'ENDPOINT', homework.ENDPOINT)
+        with FakeUpstream(change_interval=0.1) as upstream:
+            report = loadtest.run(upstream.endpoint, 4, [1, 2], 0.3)
+        assert [stage['workers'] for stage in report['stages']] == [1, 2]
+        for stage in report['stages']:
+            assert stage['polls'] > 0
+            assert stage['sends'] > 0
+            assert stage['errors'] == 0
+            assert stage['p99_lag_s'] is not None
+            assert stage['cpu_s_per_poll'] > 0
+
+    def test_sends_are_limited_to_the_fanout_rate(self, monkeypatch):
+        monkeypatch.setattr(homework, 'ENDPOINT', homework.ENDPOINT)
+        with FakeUpstream(change_interval=0.05) as upstream:
+            report = loadtest.run(upstream.endpoint, 20, [4], 0.5, rate=10)
+        stage = report['stages'][0]
+        assert stage['sends'] > 0
+        assert stage['sends_per_s'] <= 10 * 1.2
+
+    def test_saturated_stage_ends_on_time(self, monkeypatch):
+        monkeypatch.setattr(homework, 'ENDPOINT', homework.ENDPOINT)
+        with FakeUpstream(change_interval=0.05) as upstream:
+            started = time.monotonic()
+            loadtest.run(
+                upstream.endpoint, 20, [4], 0.2, send_latency=0.05, rate=5
+            )
+            assert time.monotonic() - started < 2
+
+    def test_serial_cycle_drains_a_full_outbox(self, monkeypatch):
+        monkeypatch.setattr(
+            loadtest, 'Outbox', functools.partial(Outbox, max_statuses=2)
+        )
+        with FakeUpstream(change_interval=60) as upstream:
+            monkeypatch.setattr(homework, 'ENDPOINT', upstream.endpoint)
+            bot = FakeBot(latency=0.01)
+            cycle = threading.Thread(
+                target=loadtest.serial_cycle,
+                args=(loadtest.make_subscriptions(10), bot, None),
+                daemon=True
+            )
+            cycle.start()
+            cycle.join(timeout=5)
+        assert not cycle.is_alive()
+        assert bot.sent == 10
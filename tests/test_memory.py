@@ -0,0 +1,81 @@
+import gc
+import tracemalloc
+
+import dispatch
+import homework
+from dispatch import Outbox
+from exceptions import ApiNotRespondingError
+from lru import LRUCache
+
+WEEK = 7 * 24 * 60 * 60 // homework.RETRY_TIME
+SUBSCRIPTIONS = 20
+INDEX_SIZE = 100
+
+
+class TestMemory:
+
+    def test_lru_cache_evicts_least_recently_used(self):
+        cache = LRUCache(2)
+        cache['a'] = 1
+        cache['b'] = 2
+        cache.get('a')
+        cache['c'] = 3
+        assert list(cache) == ['a', 'c']
+
+    def test_week_of_polling_stays_flat(self, monkeypatch):
+        started = 1600000000
+        clock = {'poll': 0}
+
+        def fake_request(current_timestamp, headers, session=None):
+            poll = clock['poll']
+            if poll % 10 == 0:
+                raise ApiNotRespondingError(f'response code is {500 + poll}')
+            return {
+                'homeworks': [{
+                    'id': f'{headers["Authorization"]}-{poll}',
+                    'homework_name': f'hw{poll}',
+                    'status': 'approved',
+                }],
+                'current_date': started + poll * homework.RETRY_TIME,
+            }
+
+        monkeypatch.setattr(homework, 'request_homeworks', fake_request)
+        monkeypatch.setattr(dispatch, 'LATENCY_SAMPLES', INDEX_SIZE)
+        subscriptions = [
+            homework.Subscription(f'soak-{number}', number)
+            for number in range(SUBSCRIPTIONS)
+        ]
+        for subscription in subscriptions:
+            subscription.window.index.maxsize = INDEX_SIZE
+        outbox = Outbox()
+
+        def poll_everything():
+            for subscription in subscriptions:
+                try:
+                    for item in homework.poll_subscription(subscription):
+                        outbox.put_status(
+                            subscription.chat_id, homework.parse_status(item)
+                        )
+                except ApiNotRespondingError as error:
+                    outbox.put_error(
+                        subscription.chat_id, error,
+                        f'Сбой в работе программы: {error}'
+                    )
+            outbox.drain(lambda chat_id, text: None)
+            clock['poll'] += 1
+
+        tracemalloc.start()
+        try:
+            for _ in range(2 * WEEK // 7):
+                poll_everything()
+            gc.collect()
+            warmed_up = tracemalloc.get_traced_memory()[0]
+            while clock['poll'] < WEEK:
+                poll_everything()
+            gc.collect()
+            after_week = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        assert after_week - warmed_up < 16 * 1024, (
+            f'memory grew from {warmed_up} to {after_week} bytes'
+        )
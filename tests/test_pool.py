@@ -0,0 +1,81 @@
+import threading
+import time
+
+from telegram.error import BadRequest
+
+import homework
+from fakes import FakeBot, FakeUpstream
+from pool import ThreadedPoller
+
+
+class BrokenBot(FakeBot):
+
+    def send_message(self, chat_id, text, **kwargs):
+        if chat_id == 0:
+            raise BadRequest('Chat not found')
+        return super().send_message(chat_id, text, **kwargs)
+
+
+def make_subscriptions(count):
+    return [homework.Subscription(f'pool-{number}', number)
+            for number in range(count)]
+
+
+class TestThreadedPoller:
+
+    def test_poll_once_queues_every_subscription(self, monkeypatch):
+        with FakeUpstream(change_interval=60) as upstream:
+            monkeypatch.setattr(homework, 'ENDPOINT', upstream.endpoint)
+            poller = ThreadedPoller(make_subscriptions(20), FakeBot(), 4)
+            poller.poll_once()
+            assert len(poller.outbox) == 20
+            poller.sender.start()
+            deadline = time.monotonic() + 5
+            while len(poller.outbox) and time.monotonic() < deadline:
+                time.sleep(0.01)
+            poller.stop()
+        assert poller.bot.sent == 20
+
+    def test_full_outbox_applies_backpressure(self, monkeypatch):
+        with FakeUpstream(change_interval=60) as upstream:
+            monkeypatch.setattr(homework, 'ENDPOINT', upstream.endpoint)
+            poller = ThreadedPoller(
+                make_subscriptions(20), FakeBot(), 2, max_outbox=3
+            )
+            cycle = threading.Thread(target=poller.poll_once)
+            cycle.start()
+            time.sleep(0.5)
+            assert cycle.is_alive()
+            assert len(poller.outbox) < 20
+            poller.stop()
+            cycle.join(timeout=5)
+        assert not cycle.is_alive()
+
+    def test_undeliverable_chat_does_not_block_others(self, monkeypatch):
+        with FakeUpstream(change_interval=60) as upstream:
+            monkeypatch.setattr(homework, 'ENDPOINT', upstream.endpoint)
+            poller = ThreadedPoller(make_subscriptions(10), BrokenBot(), 4)
+            poller.poll_once()
+            poller.sender.start()
+            deadline = time.monotonic() + 3
+            while len(poller.outbox) and time.monotonic() < deadline:
+                time.sleep(0.01)
+            poller.stop()
+        assert poller.bot.sent == 9
+        assert len(poller.outbox) == 0
+
+    def test_incidents_go_to_the_operator_chat(self, monkeypatch):
+        with FakeUpstream(change_interval=60, error_rate=1.0) as upstream:
+            monkeypatch.setattr(homework, 'ENDPOINT', upstream.endpoint)
+            poller = ThreadedPoller(
+                make_subscriptions(5), FakeBot(), 2, operator_chat_id='ops'
+            )
+            poller.poll_once()
+            upstream.error_rate = 0.0
+            poller.poll_once()
+            poller.sender.start()
+            deadline = time.monotonic() + 3
+            while len(poller.outbox) and time.monotonic() < deadline:
+                time.sleep(0.01)
+            poller.stop()
+        assert poller.bot.chats['ops'] == 2
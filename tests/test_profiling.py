@@ -0,0 +1,45 @@
+import profiling
+
+
+class TestProfiling:
+
+    def test_disabled_leaves_functions_untouched(self, monkeypatch):
+        monkeypatch.setattr(profiling, 'STAGES', False)
+
+        def func():
+            pass
+
+        assert profiling.timed('func')(func) is func
+        assert profiling.stage('func') is profiling.stage('other')
+
+    def test_enabled_records_stages(self, monkeypatch):
+        monkeypatch.setattr(profiling, 'STAGES', True)
+        monkeypatch.setattr(profiling, '_timings', {})
+
+        @profiling.timed('double')
+        def double(value):
+            return value * 2
+
+        assert double(2) == 4
+        assert double.__name__ == 'double'
+        with profiling.stage('block'):
+            pass
+        assert profiling._timings['double'][0] == 1
+        summary = profiling.summary()
+        assert 'double: 1 calls' in summary
+        assert 'block: 1 calls' in summary
+
+    def test_sampler_toggles(self):
+        profiling.toggle_sampler()
+        assert profiling._profiler is not None
+        profiling.toggle_sampler()
+        assert profiling._profiler is None
+
+    def test_dump_signal_is_deferred(self, monkeypatch, caplog):
+        monkeypatch.setattr(profiling, '_timings', {'stage': (1, 1.0, 1.0)})
+        caplog.set_level('INFO', logger='profiling')
+        profiling.request_dump()
+        assert not caplog.records
+        profiling.maybe_dump()
+        assert 'Stage timings' in caplog.text
+        assert not profiling._dump_requested
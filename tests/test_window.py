@@ -0,0 +1,140 @@
+import time
+
+from telegram.error import TelegramError
+
+import homework
+from fakes import FakeBot
+from window import Window
+
+
+class DownBot(FakeBot):
+
+    def send_message(self, chat_id, text, **kwargs):
+        raise TelegramError('Service unavailable')
+
+
+def reply_with(monkeypatch, *homeworks):
+    monkeypatch.setattr(
+        homework, 'fetch_subscription',
+        lambda subscription, session=None: {
+            'homeworks': list(homeworks), 'current_date': 1581600100
+        }
+    )
+
+
+def make_homework(status, updated, number=1):
+    return {
+        'id': number,
+        'homework_name': f'hw{number}',
+        'status': status,
+        'date_updated': updated,
+    }
+
+
+class TestWindow:
+
+    def test_from_date_overlaps_the_mark(self):
+        window = Window(1000, overlap=60)
+        assert window.from_date() == 940
+        assert Window(10, overlap=60).from_date() == 0
+
+    def test_overlap_is_deduplicated(self):
+        window = Window(1581600000, overlap=60)
+        homework = make_homework('reviewing', '2020-02-13T13:20:30Z')
+        assert window.advance([homework], 1581600100) == [homework]
+        assert window.advance([homework], 1581600200) == []
+        approved = make_homework('approved', '2020-02-13T13:25:00Z')
+        assert window.advance([approved], 1581600300) == [approved]
+
+    def test_missing_current_date_does_not_use_clock(self):
+        window = Window(1581600000)
+        homework = make_homework('reviewing', '2020-02-13T13:20:30Z')
+        window.advance([homework])
+        assert window.mark == 1581600030
+        window.advance([])
+        assert window.mark == 1581600030
+
+    def test_gap_is_backfilled_in_chunks(self):
+        window = Window(1581600000, chunk=3600)
+        early = make_homework('approved', '2020-02-13T13:30:00Z', 1)
+        late = make_homework('approved', '2020-02-13T16:00:00Z', 2)
+        now = 1581600000 + 4 * 3600
+        assert window.advance([early, late], now) == [early]
+        assert window.behind
+        assert window.mark == 1581600000 + 3600
+        window.advance([early, late], now)
+        assert window.advance([early, late], now) == [late]
+        window.advance([early, late], now)
+        assert not window.behind
+        assert window.mark == now
+
+    def test_unknown_status_does_not_drop_the_batch(self, monkeypatch):
+        monkeypatch.setattr(homework, 'TELEGRAM_CHAT_ID', 1)
+        weird = make_homework('weird', '2020-02-13T13:20:30Z', 1)
+        approved = make_homework('approved', '2020-02-13T13:20:30Z', 2)
+        reply_with(monkeypatch, weird, approved)
+        worker = homework.Worker(FakeBot())
+        worker.poll()
+        worker.fanout.close()
+        assert worker.bot.sent == 1
+        assert len(worker.outbox) == 0
+        assert worker.incidents.snapshot() == []
+
+    def test_worker_looks_back_after_a_restart(self, monkeypatch):
+        monkeypatch.setattr(homework, 'WINDOW_FILE', None)
+        worker = homework.Worker(FakeBot())
+        worker.fanout.close()
+        window = worker.subscription.window
+        assert window.mark <= time.time() - homework.RETRY_TIME
+
+    def test_window_file_survives_a_restart(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(homework, 'TELEGRAM_CHAT_ID', 1)
+        monkeypatch.setattr(homework, 'WINDOW_FILE', str(tmp_path / 'w'))
+        approved = make_homework('approved', '2020-02-13T13:20:30Z')
+        reply_with(monkeypatch, approved)
+        worker = homework.Worker(FakeBot())
+        worker.subscription.window.mark = 1581600000
+        worker.poll()
+        worker.fanout.close()
+        restarted = homework.Worker(worker.bot)
+        restarted.poll()
+        restarted.fanout.close()
+        assert restarted.subscription.window.mark == 1581600100
+        assert worker.bot.sent == 1
+
+    def test_digest_survives_a_restart(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(homework, 'TELEGRAM_CHAT_ID', 1)
+        monkeypatch.setattr(homework, 'WINDOW_FILE', str(tmp_path / 'w'))
+        monkeypatch.setattr(homework, 'DIGEST_WINDOW', 600)
+        reply_with(
+            monkeypatch, make_homework('approved', '2020-02-13T13:20:30Z')
+        )
+        worker = homework.Worker(FakeBot())
+        worker.subscription.window.mark = 1581600000
+        worker.poll()
+        worker.fanout.close()
+        assert worker.bot.sent == 0
+        restarted = homework.Worker(worker.bot)
+        restarted.poll()
+        assert len(restarted.digest) == 1
+        restarted.digest.window = 0
+        restarted.poll()
+        restarted.fanout.close()
+        assert worker.bot.sent == 1
+
+    def test_pending_survives_a_restart(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(homework, 'TELEGRAM_CHAT_ID', 1)
+        monkeypatch.setattr(homework, 'WINDOW_FILE', str(tmp_path / 'w'))
+        reply_with(
+            monkeypatch, make_homework('approved', '2020-02-13T13:20:30Z')
+        )
+        worker = homework.Worker(DownBot())
+        worker.subscription.window.mark = 1581600000
+        worker.poll()
+        worker.fanout.close()
+        assert worker.fanout.pending() == 1
+        restarted = homework.Worker(FakeBot())
+        restarted.poll()
+        restarted.fanout.close()
+        assert restarted.bot.sent == 1
+        assert restarted.fanout.pending() == 0
@@ -0,0 +1,78 @@
+from datetime import datetime
+
+from lru import LRUCache
+
+OVERLAP = 60
+CHUNK = 24 * 60 * 60
+INDEX_SIZE = 1000
+
+
+def updated_at(homework):
+    """This function returns `date_updated` as a timestamp or None."""
+    value = homework.get('date_updated')
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+
+
+class Window:
+    """The `from_date` window of one subscription.
+
+    `mark` is the high-water mark: every change before it has been seen.
+    Each request starts `overlap` seconds before the mark to catch late
+    commits, and repeats are dropped by the per-homework status index.
+    After downtime the mark moves at most `chunk` seconds per poll, so a
+    long gap is backfilled over several polls. The index keeps the
+    `index_size` most recently seen homeworks.
+    """
+
+    def __init__(self, mark=0, overlap=OVERLAP, chunk=CHUNK,
+                 index_size=INDEX_SIZE):
+        """This function creates a window starting at the mark."""
+        self.mark = mark
+        self.overlap = overlap
+        self.chunk = chunk
+        self.index = LRUCache(index_size)
+        self.behind = False
+
+    def dump(self):
+        """This function returns the mark and the index as JSON data."""
+        return {'mark': self.mark, 'index': list(self.index.items())}
+
+    def load(self, data):
+        """This function restores the mark and the index from `dump()`."""
+        self.mark = data['mark']
+        for key, status in data['index']:
+            self.index[key] = status
+
+    def from_date(self):
+        """This function returns `from_date` for the next request."""
+        return max(0, int(self.mark - self.overlap))
+
+    def advance(self, homeworks, current_date=None):
+        """This function moves the mark and returns changed homeworks.
+
+        Without `current_date` the mark only moves up to the latest
+        `date_updated` received, never to the local clock.
+        """
+        upto = current_date
+        self.behind = bool(
+            self.mark and current_date
+            and current_date - self.mark > self.chunk
+        )
+        if self.behind:
+            upto = self.mark + self.chunk
+        changed = []
+        latest = self.mark
+        for homework in homeworks:
+            updated = updated_at(homework)
+            if updated is not None:
+                if self.behind and updated > upto:
+                    continue
+                latest = max(latest, updated)
+            key = homework.get('id', homework.get('homework_name'))
+            if self.index.get(key) != homework.get('status'):
+                self.index[key] = homework.get('status')
+                changed.append(homework)
+        self.mark = max(self.mark, upto if upto is not None else latest)
+        return changed